@@ -0,0 +1,186 @@
+import numpy as np
+from gauss_newton import Model
+
+class Dual(object):
+    """
+    A forward mode dual number over numpy arrays. value holds the values of a
+    quantity at every point and derivs holds one array of partial
+    derivatives for each parameter. Arithmetic and the numpy functions exp,
+    log, sqrt, sin and cos carry the derivatives along, so running an array
+    valued curve on Duals gives its jacobian exactly.
+    """
+
+    def __init__(self, value, derivs):
+        """
+        Input:
+            value: the value (a number or an array)
+            derivs: list of the partial derivatives of value, one per
+                parameter
+        """
+        self.value = value
+        self.derivs = derivs
+
+    def lift(self, other):
+        """
+        Input:
+            other: a Dual or a constant
+
+        Returns:
+            other as a Dual with the same number of parameters as self
+        """
+        if isinstance(other, Dual):
+            return other
+        return Dual(other, [0.0] * len(self.derivs))
+
+    def __add__(self, other):
+        other = self.lift(other)
+        return Dual(self.value + other.value,
+                    [a + b for a, b in zip(self.derivs, other.derivs)])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = self.lift(other)
+        return Dual(self.value - other.value,
+                    [a - b for a, b in zip(self.derivs, other.derivs)])
+
+    def __rsub__(self, other):
+        return self.lift(other) - self
+
+    def __mul__(self, other):
+        other = self.lift(other)
+        return Dual(self.value * other.value,
+                    [a * other.value + self.value * b
+                     for a, b in zip(self.derivs, other.derivs)])
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = self.lift(other)
+        quotient = self.value / other.value
+        return Dual(quotient, [(a - quotient * b) / other.value
+                               for a, b in zip(self.derivs, other.derivs)])
+
+    __div__ = __truediv__
+
+    def __rtruediv__(self, other):
+        return self.lift(other) / self
+
+    __rdiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        if isinstance(other, Dual):
+            return (other * self.log()).exp()
+        value = self.value ** other
+        scale = other * self.value ** (other - 1)
+        return Dual(value, [scale * a for a in self.derivs])
+
+    def __rpow__(self, other):
+        return (self * np.log(other)).exp()
+
+    def __neg__(self):
+        return Dual(-self.value, [-a for a in self.derivs])
+
+    def __pos__(self):
+        return self
+
+    def exp(self):
+        value = np.exp(self.value)
+        return Dual(value, [value * a for a in self.derivs])
+
+    def log(self):
+        return Dual(np.log(self.value), [a / self.value for a in self.derivs])
+
+    def sqrt(self):
+        value = np.sqrt(self.value)
+        return Dual(value, [a / (2 * value) for a in self.derivs])
+
+    def sin(self):
+        return Dual(np.sin(self.value), [np.cos(self.value) * a for a in self.derivs])
+
+    def cos(self):
+        return Dual(np.cos(self.value), [-np.sin(self.value) * a for a in self.derivs])
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """
+        Lets numpy functions and arrays on the left of an operator (such as
+        np.exp(d) or xs * d) dispatch to the Dual versions
+        """
+        if method != '__call__' or kwargs or ufunc not in UFUNCS:
+            return NotImplemented
+        return UFUNCS[ufunc](*[self.lift(x) for x in inputs])
+
+UFUNCS = {
+    np.add: lambda a, b: a + b,
+    np.subtract: lambda a, b: a - b,
+    np.multiply: lambda a, b: a * b,
+    np.divide: lambda a, b: a / b,
+    np.true_divide: lambda a, b: a / b,
+    np.power: lambda a, b: a ** b,
+    np.negative: lambda a: -a,
+    np.exp: Dual.exp,
+    np.log: Dual.log,
+    np.sqrt: Dual.sqrt,
+    np.sin: Dual.sin,
+    np.cos: Dual.cos
+}
+
+def jacobian(fit, B, xs):
+    """
+    Input:
+        fit: an array valued curve fit(B, xs), like the *_curve functions in
+            gauss_newton (scalar math.* based curves can't be differentiated)
+        B: the parameters
+        xs: an array of values
+
+    Returns:
+        the jacobian of the residual vector y - fit(B, xs) with respect to B,
+        one row per x
+    """
+    n = len(B)
+    params = [Dual(b, [float(i == j) for j in range(n)]) for i, b in enumerate(B)]
+    y = fit(params, xs)
+    if not isinstance(y, Dual):
+        return np.zeros(np.shape(y) + (n,))
+    shape = np.shape(y.value)
+    return -np.stack([np.broadcast_to(d, shape) for d in y.derivs], axis=-1)
+
+def autodiff_model(fit):
+    """
+    Input:
+        fit: an array valued curve fit(B, xs)
+
+    Returns:
+        a Model for the curve whose jacobian is computed by jacobian
+    """
+    def autodiff_jacobian(B, xs):
+        return jacobian(fit, B, xs)
+
+    return Model(fit, autodiff_jacobian)
+
+def check_jacobian(model, B, xs, step=1e-6):
+    """
+    Compares a model's jacobian against central finite differences of its
+    curve.
+
+    Input:
+        model: the Model to check
+        B: the parameters to check the jacobian at
+        xs: an array of values
+        step: the finite difference step, relative to each parameter
+
+    Returns:
+        the largest difference between the two jacobians, relative to the
+        largest entry of the finite difference jacobian
+    """
+    B = np.array(B, dtype=float)
+    columns = []
+    for i in range(len(B)):
+        h = step * max(abs(B[i]), 1)
+        up, down = B.copy(), B.copy()
+        up[i] += h
+        down[i] -= h
+        columns.append(-(model.fit(up, xs) - model.fit(down, xs)) / (2 * h))
+    numeric = np.stack(columns, axis=-1)
+    difference = np.abs(model.jacobian(B, xs) - numeric).max()
+    return difference / max(np.abs(numeric).max(), 1)
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from gauss_newton import *
+from autodiff import Dual, jacobian, autodiff_model, check_jacobian
+
+class AutodiffTests(unittest.TestCase):
+
+    def setUp(self):
+        self.xs = np.linspace(1, 10, 30)
+        self.models = [(QUADRATIC, (1, 3, -1)),
+                       (EXPONENTIAL, (-0.3, 0.3, 0.3)),
+                       (LOGARITHMIC, (-2, 10, 5)),
+                       (RATIONAL, (0.9, 0.2, 0.1))]
+
+    def testMatchesAnalytic(self):
+        for model, B in self.models:
+            automatic = jacobian(model.fit, B, self.xs)
+            self.assertTrue(np.allclose(automatic, model.jacobian(B, self.xs)))
+
+    def testAnalyticJacobians(self):
+        for model, B in self.models:
+            self.assertTrue(check_jacobian(model, B, self.xs) < 1e-6)
+
+    def testScalarPartials(self):
+        # the scalar partials are checked through the scalar adapter
+        curves = [(quadratic_fit, quadratic_partial, (1, 3, -1)),
+                  (exponential_fit, exponential_partial, (-0.3, 0.3, 0.3)),
+                  (logarithmic_fit, logarithmic_partial, (-2, 10, 5)),
+                  (rational_fit, rational_partial, (0.9, 0.2, 0.1))]
+        for fit, partial, B in curves:
+            self.assertTrue(check_jacobian(scalar_model(fit, partial), B, self.xs) < 1e-6)
+
+    def testDetectsWrongJacobian(self):
+        def wrong(B, xs):
+            J = LOGARITHMIC.jacobian(B, xs)
+            J[:, 1] = -B[0] / np.log(xs + B[1])
+            return J
+        self.assertTrue(check_jacobian(Model(LOGARITHMIC.fit, wrong), (-2, 10, 5), self.xs) > 0.1)
+
+    def testFunctions(self):
+        def fit(B, xs):
+            a, b, c = B
+            return a * np.sin(b * xs) + np.sqrt(c + xs) / a - np.exp(np.cos(b * xs)) ** b + 2 ** c
+        model = autodiff_model(fit)
+        self.assertTrue(check_jacobian(model, (1.5, 0.3, 2), self.xs) < 1e-6)
+
+    def testFit(self):
+        xs = self.xs
+        points = np.column_stack([xs, exponential_curve((-0.2, 0.5, -0.07), xs)])
+        result = gauss_newton_converge(points, (-0.3, 0.3, 0.3), qr_fact_househ,
+                                       autodiff_model(exponential_curve))
+        self.assertTrue(np.allclose(result['params'], (-0.2, 0.5, -0.07)))
+
+if __name__ == '__main__':
+    unittest.main()
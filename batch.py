@@ -0,0 +1,140 @@
+import sys
+import json
+import argparse
+import multiprocessing
+
+# the optional job fields passed on to gauss_newton_converge
+OPTIONS = ('max_iterations', 'step_tolerance', 'residual_tolerance',
+           'gradient_tolerance', 'damping')
+
+# every field a job can have
+FIELDS = frozenset(('id', 'file', 'model', 'guess', 'qr') + OPTIONS)
+
+def run_batch(jobs, output, processes=None):
+    """
+    Runs a stream of fit jobs on a pool of worker processes and writes each
+    result as a line of json as soon as it is done, so results come out while
+    later jobs are still running. Results are written in the order the jobs
+    finish, each one carries the line number of its job.
+
+    Input:
+        jobs: an iterable of json lines, one job per line:
+            {"file": "points.txt", "model": "quadratic", "guess": [1, 3, -1]}
+            model is one of quadratic, exponential, logarithmic or rational,
+            or an expression such as "a*exp(b*x)+c". A job can also have an
+            "id" copied to its result, "qr" ("househ" or "givens") and any of
+            the gauss_newton_converge options max_iterations,
+            step_tolerance, residual_tolerance, gradient_tolerance and
+            damping. Blank lines are skipped.
+        output: a file to write the results to
+        processes: the number of worker processes, defaults to the cpu count,
+            1 runs every job in this process
+
+    Returns:
+        the number of jobs that failed
+    """
+    tasks = ((number, line) for number, line in enumerate(jobs, 1) if line.strip())
+    if processes == 1:
+        results = (run_job(task) for task in tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(run_job, tasks)
+    failures = 0
+    try:
+        for result in results:
+            failures += 'error' in result or result.get('reason') == 'error'
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return failures
+
+def run_job(task):
+    """
+    Input:
+        task: (line number, json line) of a job
+
+    Returns:
+        {line, id, file, model, params, iterations, residual, reason} for a
+        fit, or {line, id, error} when the job couldn't be run. A fit whose
+        solver failed has the reason 'error' and an error as well.
+    """
+    number, line = task
+    result = {'line': number}
+    try:
+        job = json.loads(line)
+        if not isinstance(job, dict):
+            raise ValueError('a job has to be a json object')
+        result['id'] = job.get('id')
+        result.update(fit_job(job))
+    # one bad job shouldn't stop the rest of the batch
+    except Exception as error:
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    return result
+
+def fit_job(job):
+    """
+    Input:
+        job: a job dictionary (see run_batch)
+
+    Returns:
+        {file, model, params, iterations, residual, reason}, with the
+        exception under error when the solver failed outright
+    """
+    # numpy and the solvers are imported by the workers the first time they
+    # need them, which keeps starting the batch (and the pool) fast
+    import numpy as np
+    from gauss_newton import CURVES, qr_fact_househ, qr_fact_givens
+    from parallel import try_fit
+
+    unknown = set(job) - FIELDS
+    if unknown:
+        raise ValueError('unknown fields {}'.format(', '.join(sorted(unknown))))
+    for field in ('file', 'model', 'guess'):
+        if field not in job:
+            raise ValueError('missing field {}'.format(field))
+    qrs = {'househ': qr_fact_househ, 'givens': qr_fact_givens}
+    qr = job.get('qr', 'househ')
+    if qr not in qrs:
+        raise ValueError('unknown qr {}, expected househ or givens'.format(qr))
+
+    fit = dict(CURVES).get(job['model'], job['model'])
+    options = dict((option, job[option]) for option in OPTIONS if option in job)
+    result = try_fit(job['file'], [float(b) for b in job['guess']], qrs[qr], fit, None,
+                     options)
+    output = {
+        'file': job['file'],
+        'model': job['model'],
+        'params': [float(b) for b in result['params']],
+        'iterations': result['iterations'],
+        # json has no infinity, a fit that failed outright has no residual
+        'residual': float(result['residual']) if np.isfinite(result['residual']) else None,
+        'reason': result['reason']
+    }
+    if 'error' in result:
+        output['error'] = result['error']
+    return output
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Runs a json lines file of curve fits')
+    parser.add_argument('jobs', help="the json lines file of jobs, '-' for stdin")
+    parser.add_argument('--output', help='write the results here instead of stdout')
+    parser.add_argument('--processes', type=int, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    jobs = sys.stdin if args.jobs == '-' else open(args.jobs)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        failures = run_batch(jobs, output, args.processes)
+    finally:
+        if jobs is not sys.stdin:
+            jobs.close()
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+import numpy as np
+from StringIO import StringIO
+from batch import run_batch
+from gauss_newton import QUADRATIC, EXPONENTIAL
+
+PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+class BatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        xs = np.linspace(1, 10, 40)
+        self.quadratic = os.path.join(self.directory, 'quadratic.npy')
+        np.save(self.quadratic, np.column_stack([xs, QUADRATIC.fit(np.array([1.0, 3.0, -1.0]), xs)]))
+        self.exponential = os.path.join(self.directory, 'exponential.npy')
+        np.save(self.exponential,
+                np.column_stack([xs, EXPONENTIAL.fit(np.array([-0.2, 0.5, -0.07]), xs)]))
+        self.jobs = [
+            json.dumps({'id': 'q', 'file': self.quadratic, 'model': 'quadratic',
+                        'guess': [0, 0, 0]}),
+            json.dumps({'id': 'e', 'file': self.exponential, 'model': 'exponential',
+                        'guess': [-0.3, 0.3, 0.3], 'qr': 'givens', 'max_iterations': 50}),
+            '',
+            json.dumps({'id': 'x', 'file': self.quadratic, 'model': 'a + b*x + c*x**2',
+                        'guess': [0, 0, 0]}),
+            json.dumps({'id': 'm', 'file': os.path.join(self.directory, 'missing.txt'),
+                        'model': 'quadratic', 'guess': [0, 0, 0]}),
+            '[1, 2]',
+            json.dumps({'id': 't', 'file': self.quadratic, 'model': 'quadratic',
+                        'guess': [0, 0, 0], 'tolerance': 1}),
+            # two identical columns in the jacobian and no damping to rescue it
+            json.dumps({'id': 'r', 'file': self.quadratic, 'model': 'a*x + b*x',
+                        'guess': [1, 1], 'damping': 0})
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_jobs(self, processes):
+        output = StringIO()
+        failures = run_batch(self.jobs, output, processes)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        return failures, dict((result['line'], result) for result in results)
+
+    def checkResults(self, processes):
+        failures, results = self.run_jobs(processes)
+        self.assertEqual(failures, 4)
+        self.assertEqual(sorted(results), [1, 2, 4, 5, 6, 7, 8])
+        self.assertTrue(np.allclose(results[1]['params'], [1, 3, -1]))
+        self.assertTrue(np.allclose(results[2]['params'], [-0.2, 0.5, -0.07], atol=1e-6))
+        self.assertEqual(results[2]['id'], 'e')
+        self.assertTrue(np.allclose(results[4]['params'], [-1, 3, 1]))
+        self.assertTrue(results[5]['error'].startswith('IOError'))
+        self.assertTrue('error' in results[6])
+        self.assertTrue('unknown fields tolerance' in results[7]['error'])
+        self.assertEqual(results[8]['reason'], 'error')
+        self.assertEqual(results[8]['residual'], None)
+        self.assertTrue(results[8]['error'].startswith('LinAlgError'))
+
+    def testInProcess(self):
+        self.checkResults(1)
+
+    def testPool(self):
+        self.checkResults(2)
+
+    def testLazyImports(self):
+        # starting a batch, through batch.py or main.py, doesn't load numpy
+        code = 'import sys, main, batch; sys.exit("numpy" in sys.modules)'
+        self.assertEqual(subprocess.call([sys.executable, '-c', code], cwd=PACKAGE), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import shutil
+import timeit
+import tempfile
+import argparse
+import resource
+import numpy as np
+from factorizations import househ_factor, househ_factor_blocked, qr_fact_househ, \
+    qr_fact_givens, BLOCK_SIZE
+from gauss_newton import gauss_newton, QUADRATIC, EXPONENTIAL, LOGARITHMIC, RATIONAL
+from power_method import power_method_batch
+from autodiff import autodiff_model
+
+# a run regresses when it is this much slower than the baseline
+REGRESSION_THRESHOLD = 0.25
+
+# the built in models with parameters that behave well for x in [1, 10]
+MODELS = [('quadratic', QUADRATIC, (1, 3, -1)),
+          ('exponential', EXPONENTIAL, (-0.3, 0.3, 0.3)),
+          ('logarithmic', LOGARITHMIC, (-2, 10, 5)),
+          ('rational', RATIONAL, (0.9, 0.2, 0.1))]
+
+def time_call(function, repeats=1):
+    """
+    Input:
+        function: a function taking no arguments
+        repeats: number of times to run the function
+
+    Returns:
+        the best wall time in seconds over all of the runs
+    """
+    best = float('inf')
+    for i in range(repeats):
+        start = timeit.default_timer()
+        function()
+        best = min(best, timeit.default_timer() - start)
+    return best
+
+def measure(name, function, flops, repeats=1):
+    """
+    Input:
+        name: the name the measurement is recorded under
+        function: a function taking no arguments
+        flops: the number of floating point operations one call does
+        repeats: number of timed runs, the best one is kept
+
+    Returns:
+        {name, time, memory, flop_rate} with the best wall time in seconds,
+        the peak memory the runs used on top of what was already resident in
+        bytes and the flop rate of the best run in flops per second
+    """
+    reset_peak_memory()
+    start = resident_memory()
+    time = time_call(function, repeats)
+    return {
+        'name': name,
+        'time': time,
+        'memory': max(peak_memory() - start, 0),
+        'flop_rate': flops / time if time else 0.0
+    }
+
+def resident_memory():
+    """
+    Returns:
+        the memory currently resident for this process in bytes, 0 where
+        /proc isn't available
+    """
+    return proc_status('VmRSS')
+
+def peak_memory():
+    """
+    Returns:
+        the peak resident memory of this process in bytes since the last
+        reset_peak_memory. Without /proc this falls back on getrusage, which
+        can't be reset and so only ever grows.
+    """
+    return proc_status('VmHWM') or \
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def reset_peak_memory():
+    """
+    Resets the peak resident memory of this process to what is resident now
+    so the next measurement only sees its own peak (linux only)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except (IOError, OSError):
+        pass
+
+def proc_status(field):
+    """
+    Input:
+        field: a memory field of /proc/self/status such as VmRSS
+
+    Returns:
+        the field in bytes, 0 if it can't be read
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return 0
+
+def qr_flops(m, n):
+    """
+    Returns:
+        the floating point operations of a householder qr of an m x n matrix
+    """
+    return 2.0 * m * n * n - 2.0 * n ** 3 / 3
+
+def benchmark_qr(sizes, block_size=BLOCK_SIZE, repeats=1, seed=0):
+    """
+    Compares the unblocked and blocked householder factorizations on square
+    random matrices
+
+    Input:
+        sizes: the number of columns (and rows) of each matrix
+        block_size: the panel width used by the blocked factorization
+        repeats: number of timed runs per size, the best one is kept
+        seed: seed for the random matrices so runs are reproducible
+
+    Returns:
+        a list of {size, unblocked, blocked, speedup} with times in seconds
+    """
+    random = np.random.RandomState(seed)
+    results = []
+    for n in sizes:
+        A = random.standard_normal((n, n))
+        unblocked = time_call(lambda: househ_factor(A), repeats)
+        blocked = time_call(lambda: househ_factor_blocked(A, block_size), repeats)
+        results.append({
+            'size': n,
+            'unblocked': unblocked,
+            'blocked': blocked,
+            'speedup': unblocked / blocked
+        })
+    return results
+
+def benchmark_jacobians(points=10 ** 6, repeats=3):
+    """
+    Compares the hand written jacobians of the built in models against the
+    ones computed by forward mode automatic differentiation
+
+    Input:
+        points: the number of x values to evaluate the jacobians at
+        repeats: number of timed runs per model, the best one is kept
+
+    Returns:
+        a list of {model, analytic, autodiff, slowdown} with times in seconds
+    """
+    xs = np.linspace(1, 10, points)
+    results = []
+    for name, model, B in MODELS:
+        automatic = autodiff_model(model.fit)
+        analytic = time_call(lambda: model.jacobian(B, xs), repeats)
+        autodiff = time_call(lambda: automatic.jacobian(B, xs), repeats)
+        results.append({
+            'model': name,
+            'analytic': analytic,
+            'autodiff': autodiff,
+            'slowdown': autodiff / analytic
+        })
+    return results
+
+def benchmark_factorizations(shapes, repeats=1, seed=0):
+    """
+    Times the householder and givens qr factorizations in 'economic' mode on
+    random m x n matrices
+
+    Input:
+        shapes: a list of (m, n) matrix shapes
+        repeats: number of timed runs per shape, the best one is kept
+        seed: seed for the random matrices so runs are reproducible
+
+    Returns:
+        a list of measure results named like 'qr househ 1000x100'
+    """
+    random = np.random.RandomState(seed)
+    results = []
+    for m, n in shapes:
+        A = random.standard_normal((m, n))
+        for name, qr in (('househ', qr_fact_househ), ('givens', qr_fact_givens)):
+            # givens does m n^2 rotations of 6 flops against 2 m n^2 for householder
+            flops = qr_flops(m, n) * (3 if qr is qr_fact_givens else 1)
+            results.append(measure('qr {} {}x{}'.format(name, m, n),
+                                   lambda: qr(A, mode='economic'), flops, repeats))
+    return results
+
+def benchmark_gauss_newton(sizes, iterations=5, repeats=1, seed=0):
+    """
+    Times gauss_newton on every built in model. The points are noisy samples
+    of each curve, written to a temporary .npy file that gauss_newton reads
+    back the same way it reads real data.
+
+    Input:
+        sizes: the numbers of points to fit
+        iterations: the number of gauss-newton iterations per fit
+        repeats: number of timed runs per fit, the best one is kept
+        seed: seed for the noise so runs are reproducible
+
+    Returns:
+        a list of measure results named like 'gauss_newton quadratic 1000'
+    """
+    random = np.random.RandomState(seed)
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for points in sizes:
+            xs = np.linspace(1, 10, points)
+            noise = 0.01 * random.standard_normal(points)
+            for name, model, B in MODELS:
+                filename = os.path.join(directory, '{}.npy'.format(name))
+                np.save(filename, np.column_stack([xs, model.fit(np.array(B), xs) + noise]))
+                # a qr of the points x parameters jacobian per iteration
+                flops = (iterations + 1) * qr_flops(points, len(B))
+                results.append(measure(
+                    'gauss_newton {} {}'.format(name, points),
+                    lambda: gauss_newton(filename, B, iterations, qr_fact_househ, model, None),
+                    flops, repeats))
+                os.remove(filename)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def benchmark_power_method(batches, tolerance=1e-10, max_iterations=1000, repeats=1,
+                           seed=0):
+    """
+    Times power_method_batch on stacks of random symmetric matrices
+
+    Input:
+        batches: a list of (N, n) pairs, N matrices of size n x n
+        tolerance, max_iterations: passed on to power_method_batch
+        repeats: number of timed runs per batch, the best one is kept
+        seed: seed for the random matrices so runs are reproducible
+
+    Returns:
+        a list of measure results named like 'power_method 1000x4'
+    """
+    random = np.random.RandomState(seed)
+    results = []
+    for N, n in batches:
+        A = random.uniform(-2, 2, (N, n, n))
+        A = A + A.transpose(0, 2, 1)
+        guess = np.ones(n)
+        iterations = power_method_batch(A, guess, tolerance, max_iterations)['iterations']
+        # a matrix vector product, rayleigh quotient and norm per iteration
+        flops = float(iterations.sum()) * (2 * n * n + 6 * n)
+        results.append(measure('power_method {}x{}'.format(N, n),
+                               lambda: power_method_batch(A, guess, tolerance, max_iterations),
+                               flops, repeats))
+    return results
+
+def run_suite(shapes, points, batches, repeats=1):
+    """
+    Input:
+        shapes: the matrix shapes for benchmark_factorizations
+        points: the numbers of points for benchmark_gauss_newton
+        batches: the (N, n) stacks for benchmark_power_method
+        repeats: number of timed runs per benchmark
+
+    Returns:
+        the results of every benchmark in one list
+    """
+    return benchmark_factorizations(shapes, repeats) + \
+        benchmark_gauss_newton(points, repeats=repeats) + \
+        benchmark_power_method(batches, repeats=repeats)
+
+def write_results(results, filename):
+    """
+    Input:
+        results: a list of measure results
+        filename: the json file to write them to
+    """
+    with open(filename, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+def read_results(filename):
+    """
+    Input:
+        filename: a json file written by write_results
+
+    Returns:
+        the list of measure results in the file
+    """
+    with open(filename) as source:
+        return json.load(source)
+
+def regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Input:
+        results: a list of measure results
+        baseline: a list of measure results to compare against
+        threshold: how much slower than the baseline a benchmark can get
+            before it counts as a regression, 0.25 is 25% slower
+
+    Returns:
+        a list of {name, time, baseline, slowdown} for every benchmark in
+        both lists that is slower than the baseline by more than threshold
+    """
+    expected = dict((result['name'], result['time']) for result in baseline)
+    slower = []
+    for result in results:
+        before = expected.get(result['name'])
+        if before and result['time'] > before * (1 + threshold):
+            slower.append({
+                'name': result['name'],
+                'time': result['time'],
+                'baseline': before,
+                'slowdown': result['time'] / before
+            })
+    return slower
+
+def parse_shapes(text):
+    """
+    Input:
+        text: comma separated sizes like '1000x100,2000x50'
+
+    Returns:
+        the list of (rows, columns) pairs
+    """
+    return [tuple(int(n) for n in shape.split('x')) for shape in text.split(',')]
+
+def parse_sizes(text):
+    """
+    Input:
+        text: comma separated integers like '1000,10000'
+
+    Returns:
+        the list of integers
+    """
+    return [int(float(n)) for n in text.split(',')]
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks the factorizations, '
+                                     'gauss-newton and the power method')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        help='square matrix sizes for the blocked qr comparison')
+    parser.add_argument('--shapes', type=parse_shapes, default='1000x10,10000x10,1000x100',
+                        help='qr matrix shapes, such as 1000x10,1000x100')
+    parser.add_argument('--points', type=parse_sizes, default='1e3,1e4,1e5,1e6',
+                        help='gauss-newton point counts, up to 1e7')
+    parser.add_argument('--batches', type=parse_shapes, default='1000x4,100x50,10x200',
+                        help='power method stacks as matrices x size')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--baseline', help='fail if slower than the results in this json file')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='allowed slowdown against the baseline, 0.25 is 25%%')
+    args = parser.parse_args(argv)
+
+    if args.sizes:
+        print 'size    unblocked (s)   blocked (s)   speedup'
+        for result in benchmark_qr(args.sizes):
+            print '{size:<7} {unblocked:<15.3f} {blocked:<13.3f} {speedup:.1f}x'.format(**result)
+        print
+        print 'model         analytic (s)   autodiff (s)   slowdown'
+        for result in benchmark_jacobians():
+            print '{model:<13} {analytic:<14.3f} {autodiff:<14.3f} {slowdown:.1f}x'.format(**result)
+        print
+
+    results = run_suite(args.shapes, args.points, args.batches, args.repeats)
+    print 'benchmark                          time (s)   memory (MB)   GFLOP/s'
+    for result in results:
+        print '{:<34} {:<10.4f} {:<13.1f} {:.2f}'.format(
+            result['name'], result['time'], result['memory'] / 2.0 ** 20,
+            result['flop_rate'] / 1e9)
+    if args.output:
+        write_results(results, args.output)
+
+    if args.baseline:
+        slower = regressions(results, read_results(args.baseline), args.threshold)
+        for result in slower:
+            print 'REGRESSION {name}: {time:.4f}s against {baseline:.4f}s ' \
+                '({slowdown:.2f}x)'.format(**result)
+        if slower:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from benchmarks import *
+
+class BenchmarkTests(unittest.TestCase):
+
+    def testSuite(self):
+        results = run_suite([(50, 5)], [100], [(10, 3)])
+        names = [result['name'] for result in results]
+        self.assertEqual(names, ['qr househ 50x5', 'qr givens 50x5',
+                                 'gauss_newton quadratic 100', 'gauss_newton exponential 100',
+                                 'gauss_newton logarithmic 100', 'gauss_newton rational 100',
+                                 'power_method 10x3'])
+        for result in results:
+            self.assertTrue(result['time'] > 0)
+            self.assertTrue(result['memory'] >= 0)
+            self.assertTrue(result['flop_rate'] > 0)
+
+    def testRegressions(self):
+        baseline = [{'name': 'a', 'time': 1.0}, {'name': 'b', 'time': 1.0}]
+        results = [{'name': 'a', 'time': 1.2}, {'name': 'b', 'time': 1.5},
+                   {'name': 'c', 'time': 9.0}]
+        slower = regressions(results, baseline, 0.25)
+        self.assertEqual([result['name'] for result in slower], ['b'])
+        self.assertAlmostEqual(slower[0]['slowdown'], 1.5)
+        self.assertEqual(regressions(results, baseline, 0.1)[0]['name'], 'a')
+
+    def testResultsRoundTrip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'results.json')
+            results = [{'name': 'a', 'time': 1.0, 'memory': 2, 'flop_rate': 3.0}]
+            write_results(results, filename)
+            self.assertEqual(read_results(filename), results)
+        finally:
+            shutil.rmtree(directory)
+
+    def testMainFailsOnRegression(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'baseline.json')
+            options = ['--shapes', '20x3', '--points', '50', '--batches', '2x2']
+            self.assertEqual(main(options + ['--output', filename]), 0)
+            results = read_results(filename)
+            for result in results:
+                result['time'] = 1e-9
+            write_results(results, filename)
+            self.assertEqual(main(options + ['--baseline', filename]), 1)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import ast
+import numpy as np
+from collections import OrderedDict
+from gauss_newton import Model
+
+# number of compiled models kept by compile_model
+MODEL_CACHE_SIZE = 128
+model_cache = OrderedDict()
+
+# functions that can be called in an expression
+FUNCTIONS = ('exp', 'log', 'sqrt', 'sin', 'cos')
+
+# names that are constants rather than parameters
+CONSTANTS = {'pi': np.pi, 'e': np.e}
+
+OPERATORS = {
+    ast.Add: 'add',
+    ast.Sub: 'sub',
+    ast.Mult: 'mul',
+    ast.Div: 'div',
+    ast.Pow: 'pow'
+}
+
+SYMBOLS = {'add': '+', 'sub': '-', 'mul': '*', 'div': '/', 'pow': '**'}
+
+# names used by the generated code that can't be parameters
+RESERVED = set(['np', 'B', 'zeros', 'out'])
+
+def compile_model(expression, params=None, variable='x'):
+    """
+    Turns a curve written as a string, such as 'a*exp(b*x)+c', into a Model.
+    The expression is parsed and differentiated symbolically once, and both
+    the curve and its jacobian are compiled into numpy functions. Compiled
+    models are cached by expression so fitting the same curve again skips
+    all of that.
+
+    Input:
+        expression: the curve, using +, -, *, /, **, the functions exp, log,
+            sqrt, sin and cos and the constants pi and e
+        params: the names of the parameters in the order they appear in B,
+            defaults to every other name in the expression sorted
+        variable: the name of the independent variable
+
+    Returns:
+        a Model for the curve
+    """
+    key = (expression, tuple(params) if params else None, variable)
+    if key in model_cache:
+        model = model_cache.pop(key)
+    else:
+        model = build_model(expression, params, variable)
+        if len(model_cache) >= MODEL_CACHE_SIZE:
+            model_cache.popitem(last=False)
+    model_cache[key] = model
+    return model
+
+def parameters(expression, variable='x'):
+    """
+    Input:
+        expression: a curve written as a string
+        variable: the name of the independent variable
+
+    Returns:
+        the sorted names of the parameters in the expression, the default
+        order of B used by compile_model
+    """
+    return sorted(names(parse(expression)) - set([variable]))
+
+def build_model(expression, params, variable):
+    """
+    Input:
+        expression, params, variable: as for compile_model
+
+    Returns:
+        a freshly compiled Model for the expression
+    """
+    tree = parse(expression)
+    found = names(tree) - set([variable])
+    if params is None:
+        params = sorted(found)
+    unknown = found - set(params)
+    if unknown:
+        raise ValueError('Unknown names {} in {}'.format(sorted(unknown), expression))
+    reserved = (set(params) | set([variable])) & RESERVED
+    if reserved:
+        raise ValueError('Reserved names {} in {}'.format(sorted(reserved), expression))
+
+    derivatives = [derivative(tree, p) for p in params]
+    unpack = '    {}, = B\n'.format(', '.join(params)) if params else ''
+    source = (
+        'def fit(B, {x}):\n'
+        '{unpack}'
+        '    return {fit}\n'
+        '\n'
+        'def jacobian(B, {x}, out=None):\n'
+        '{unpack}'
+        '    if out is None:\n'
+        '        zeros = np.zeros(np.broadcast({x}, *B).shape)\n'
+        '        return -np.stack([{columns}], axis=-1)\n'
+        '{assignments}'
+        '    return np.negative(out, out=out)\n'
+    ).format(x=variable, unpack=unpack, fit=generate(tree),
+             columns=', '.join('zeros + {}'.format(generate(d)) for d in derivatives),
+             assignments=''.join('    out[..., {}] = {}\n'.format(i, generate(d))
+                                 for i, d in enumerate(derivatives)))
+
+    namespace = {'np': np}
+    exec(compile(source, '<model {}>'.format(expression), 'exec'), namespace)
+    return Model(namespace['fit'], namespace['jacobian'])
+
+def parse(expression):
+    """
+    Input:
+        expression: a curve written as a string
+
+    Returns:
+        the expression as a tree of tuples:
+        ('const', value), ('var', name), (operator, left, right),
+        ('neg', operand) or ('call', function, argument)
+    """
+    try:
+        body = ast.parse(expression.strip(), mode='eval').body
+    except SyntaxError:
+        raise ValueError('Unable to parse expression {}'.format(expression))
+    return convert(body, expression)
+
+def convert(node, expression):
+    """
+    Input:
+        node: a python ast node
+        expression: the whole expression, for error messages
+
+    Returns:
+        the node as a tree of tuples (see parse)
+    """
+    if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        return (OPERATORS[type(node.op)], convert(node.left, expression),
+                convert(node.right, expression))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return negate(convert(node.operand, expression))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.UAdd):
+        return convert(node.operand, expression)
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            return ('const', CONSTANTS[node.id])
+        return ('var', node.id)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+            and node.func.id in FUNCTIONS and len(node.args) == 1 and not node.keywords:
+        return ('call', node.func.id, convert(node.args[0], expression))
+    number = getattr(node, 'n', getattr(node, 'value', None))
+    if isinstance(number, (int, long, float)) and not isinstance(number, bool):
+        return ('const', float(number))
+    raise ValueError('Unsupported syntax in expression {}'.format(expression))
+
+def names(tree):
+    """
+    Input:
+        tree: an expression tree
+
+    Returns:
+        the set of variable names used in the tree
+    """
+    if tree[0] == 'var':
+        return set([tree[1]])
+    if tree[0] == 'const':
+        return set()
+    return set().union(*[names(child) for child in tree[1:] if isinstance(child, tuple)])
+
+def derivative(tree, name):
+    """
+    Input:
+        tree: an expression tree
+        name: the variable to differentiate with respect to
+
+    Returns:
+        the derivative of the tree as a simplified expression tree
+    """
+    kind = tree[0]
+    if kind == 'const':
+        return ('const', 0.0)
+    if kind == 'var':
+        return ('const', 1.0 if tree[1] == name else 0.0)
+    if kind == 'neg':
+        return negate(derivative(tree[1], name))
+    if kind == 'call':
+        function, argument = tree[1], tree[2]
+        inner = derivative(argument, name)
+        if function == 'exp':
+            outer = tree
+        elif function == 'log':
+            outer = divide(('const', 1.0), argument)
+        elif function == 'sqrt':
+            outer = divide(('const', 0.5), tree)
+        elif function == 'sin':
+            outer = ('call', 'cos', argument)
+        else:
+            outer = negate(('call', 'sin', argument))
+        return multiply(outer, inner)
+
+    left, right = tree[1], tree[2]
+    d_left, d_right = derivative(left, name), derivative(right, name)
+    if kind == 'add':
+        return add(d_left, d_right)
+    if kind == 'sub':
+        return subtract(d_left, d_right)
+    if kind == 'mul':
+        return add(multiply(d_left, right), multiply(left, d_right))
+    if kind == 'div':
+        return subtract(divide(d_left, right),
+                        divide(multiply(left, d_right), power(right, ('const', 2.0))))
+    # power
+    if is_zero(d_right):
+        exponent = subtract(right, ('const', 1.0))
+        return multiply(multiply(right, power(left, exponent)), d_left)
+    return multiply(tree, add(multiply(d_right, ('call', 'log', left)),
+                              divide(multiply(right, d_left), left)))
+
+def is_zero(tree):
+    return tree == ('const', 0.0)
+
+def is_one(tree):
+    return tree == ('const', 1.0)
+
+def fold(kind, left, right):
+    """
+    Input:
+        kind: a binary operator
+        left, right: expression trees
+
+    Returns:
+        the tree (kind, left, right), computed right away if both sides are
+        constants
+    """
+    if left[0] == 'const' and right[0] == 'const':
+        a, b = left[1], right[1]
+        values = {'add': lambda: a + b, 'sub': lambda: a - b, 'mul': lambda: a * b,
+                  'div': lambda: a / b, 'pow': lambda: a ** b}
+        return ('const', values[kind]())
+    return (kind, left, right)
+
+def add(left, right):
+    if is_zero(left):
+        return right
+    if is_zero(right):
+        return left
+    return fold('add', left, right)
+
+def subtract(left, right):
+    if is_zero(right):
+        return left
+    if is_zero(left):
+        return negate(right)
+    return fold('sub', left, right)
+
+def multiply(left, right):
+    if is_zero(left) or is_zero(right):
+        return ('const', 0.0)
+    if is_one(left):
+        return right
+    if is_one(right):
+        return left
+    return fold('mul', left, right)
+
+def divide(left, right):
+    if is_zero(left):
+        return ('const', 0.0)
+    if is_one(right):
+        return left
+    return fold('div', left, right)
+
+def power(left, right):
+    if is_zero(right):
+        return ('const', 1.0)
+    if is_one(right):
+        return left
+    return fold('pow', left, right)
+
+def negate(tree):
+    if tree[0] == 'const':
+        return ('const', -tree[1])
+    if tree[0] == 'neg':
+        return tree[1]
+    return ('neg', tree)
+
+def generate(tree):
+    """
+    Input:
+        tree: an expression tree
+
+    Returns:
+        python source code evaluating the tree with numpy
+    """
+    kind = tree[0]
+    if kind == 'const':
+        return repr(tree[1])
+    if kind == 'var':
+        return tree[1]
+    if kind == 'neg':
+        return '(-{})'.format(generate(tree[1]))
+    if kind == 'call':
+        return 'np.{}({})'.format(tree[1], generate(tree[2]))
+    return '({} {} {})'.format(generate(tree[1]), SYMBOLS[kind], generate(tree[2]))
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from gauss_newton import *
+from autodiff import check_jacobian
+from expressions import compile_model, parameters
+
+class ExpressionsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.xs = np.linspace(1, 10, 30)
+
+    def testMatchesBuiltInModels(self):
+        curves = [('a*x**2 + b*x + c', QUADRATIC, (1, 3, -1)),
+                  ('a*exp(b*x) + c', EXPONENTIAL, (-0.3, 0.3, 0.3)),
+                  ('a*log(x + b) + c', LOGARITHMIC, (-2, 10, 5)),
+                  ('a*x / (x + b) + c', RATIONAL, (0.9, 0.2, 0.1))]
+        for expression, model, B in curves:
+            compiled = compile_model(expression)
+            self.assertTrue(np.allclose(compiled.fit(B, self.xs), model.fit(B, self.xs)))
+            self.assertTrue(np.allclose(compiled.jacobian(B, self.xs),
+                                        model.jacobian(B, self.xs)))
+            out = np.empty((len(self.xs), 3))
+            compiled.jacobian(B, self.xs, out=out)
+            self.assertTrue(np.allclose(out, model.jacobian(B, self.xs)))
+
+    def testSymbolicDerivatives(self):
+        model = compile_model('a*sin(b*x)/sqrt(c + x) - x**b + 2**c - cos(pi*a)')
+        self.assertTrue(check_jacobian(model, (1.5, 0.3, 2), self.xs) < 1e-6)
+
+    def testParameters(self):
+        self.assertEqual(parameters('k*exp(-x/tau) + offset'), ['k', 'offset', 'tau'])
+        model = compile_model('a*x + b', params=['b', 'a'])
+        self.assertTrue(np.allclose(model.fit((1, 2), self.xs), 2 * self.xs + 1))
+        # constant columns still get one entry per point
+        self.assertEqual(model.jacobian((1, 2), self.xs).shape, (30, 2))
+        out = model.jacobian((1, 2), self.xs, out=np.empty((30, 2)))
+        self.assertTrue(np.allclose(out, model.jacobian((1, 2), self.xs)))
+
+    def testCache(self):
+        self.assertTrue(compile_model('a*exp(b*x) + c') is compile_model('a*exp(b*x) + c'))
+
+    def testFit(self):
+        points = np.column_stack([self.xs, EXPONENTIAL.fit((-0.2, 0.5, -0.07), self.xs)])
+        result = gauss_newton_converge(points, (-0.3, 0.3, 0.3), qr_fact_househ,
+                                       'a*exp(b*x) + c')
+        self.assertTrue(np.allclose(result['params'], (-0.2, 0.5, -0.07)))
+
+    def testInvalid(self):
+        for expression in ('a*foo(x)', 'a +', 'x[0]', '__import__("os")', 'np*x'):
+            self.assertRaises(ValueError, compile_model, expression)
+        self.assertRaises(ValueError, compile_model, 'out*x')
+        self.assertRaises(ValueError, compile_model, 'a*x + b', ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
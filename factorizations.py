@@ -1,145 +1,508 @@
 import numpy as np 
 import math
+import inspect
 
-def qr_fact_househ(A):
+# number of columns factored per panel by the blocked householder qr
+BLOCK_SIZE = 32
+
+# pivots smaller than this relative to the largest one are treated as zero
+PIVOT_TOLERANCE = 1e-12
+
+def qr_fact_househ(A, mode='full', block_size=BLOCK_SIZE, rhs=None, overwrite=False):
     """
     Input:
         A: a matrix
-    
-    Returns:
-        (q, r) the qr factorization of matrix A using householder reflections
-    """
-    rows, height  = A.shape
-    H = househ_reflection(A.transpose()[0])
-    reflections = []
-    reflections.append(A)
-    reflections.append(H)
-    for i in range(1, height):
-        # multiply in reverse order to get the latest H
-        resultant = reduce(lambda x, y: np.dot(x, y), reflections[::-1])
-        column = resultant.transpose()[i][i:]
-        minor = househ_reflection(column)
-        H = embed(np.eye(rows), minor)
-        reflections.append(H)
-
-    # Compute q by multiplying together all of the H's in order
-    q = reduce(lambda x, y: np.dot(x, y), reflections[1:])
-    r = np.dot(q.transpose(), A)
-
-    print 'Q is '
-    print q
-    print 'R is '
-    print r
+        mode: 'full' returns the square q, 'economic' returns the thin
+            rows x cols q and the cols x cols r, 'solve' never builds q and
+            returns (r, q.transpose() * rhs) instead
+        block_size: the number of columns per panel, None for the unblocked
+            column at a time factorization
+        rhs: the vector (or matrix) to multiply by q.transpose() in 'solve'
+            mode
+        overwrite: factor A (a float array) in place and, in 'solve' mode,
+            multiply rhs (a float array) in place instead of copying them.
+            Both are overwritten and r and qtb are views of them.
 
-    return q, r
+    Returns:
+        (q, r) the qr factorization of matrix A using householder reflections.
+        In 'solve' mode (r, qtb) where r is cols x cols and qtb is
+        q.transpose() * rhs. The first cols entries of qtb are the right hand
+        side for r, the norm of the rest is the least squares residual.
+    """
+    if block_size:
+        V, tau, R = househ_factor_blocked(A, block_size, overwrite)
+    else:
+        V, tau, R = househ_factor(A, overwrite)
+    rows, cols = R.shape
+    k = min(rows, cols)
+    if mode == 'solve':
+        qtb = rhs if overwrite else np.array(rhs, dtype=float)
+        return R[:k], househ_apply(V, tau, qtb, True, block_size)
+    if mode == 'economic':
+        return househ_q(V, tau, k, block_size), R[:k]
+    return househ_q(V, tau, rows, block_size), R
 
-def qr_fact_givens(A):
+def househ_factor(A, overwrite=False):
     """
     Input:
         A: a matrix
-    
+        overwrite: factor A (a float array) in place, R is then A itself
+
     Returns:
-        (q, r) the qr factorization of A using givens rotations
+        (V, tau, R) the compact householder factorization of A. Column k of V
+        holds the reflector vector v (with v[k] = 1 and zeros above it) so that
+        H_k = I - tau[k] * v * v.transpose(), and q = H_0 H_1 ... H_k-1. The
+        dense H matrices are never formed.
     """
-    rows, cols = A.shape
-    reflections = []
-    for i in range(0, cols):
-        for j in range(0, rows):
-            if i == j:
-                pivot_pos = (j, i)
-            if i < j:
-                if A[j][i]:
-                    G = givens_rotation(A, np.eye(rows), pivot_pos, (j, i))
-                    reflections.append(G)
-                    A = np.dot(G, A)
-    R = A
-    Q = reduce(lambda x, y: np.dot(x.transpose(), y.transpose()), reflections)
-    return Q, R
+    R = A if overwrite else np.array(A, dtype=float)
+    rows, cols = R.shape
+    k = min(rows, cols)
+    V = np.zeros((rows, k))
+    tau = np.zeros(k)
+    for i in range(k):
+        v, tau[i], beta = househ_vector(R[i:, i])
+        V[i:, i] = v
+        # apply the reflector to the trailing columns in place
+        if tau[i] and i + 1 < cols:
+            trailing = R[i:, i + 1:]
+            trailing -= tau[i] * np.outer(v, np.dot(v, trailing))
+        R[i, i] = beta
+        R[i + 1:, i] = 0
+    return V, tau, R
 
-def givens_rotation(A, I, xpos, ypos):
+def househ_factor_blocked(A, block_size=BLOCK_SIZE, overwrite=False):
     """
-        Input:
-            A:
-            xpos:
-            ypos:
+    Input:
+        A: a matrix
+        block_size: the number of columns in each panel
+        overwrite: factor A (a float array) in place, R is then A itself
 
-        Returns:
-            the givens matrix for the x and y
+    Returns:
+        (V, tau, R) the same compact factorization as househ_factor. Each
+        panel of block_size columns is factored on its own, then its
+        reflectors are applied to the rest of the matrix at once as
+        I - V * T * V.transpose(), a single large matrix product.
     """
-    x , y = xpos
-    i , j = ypos
-
-    xval = A[x][y]
-    yval = A[i][j]
+    R = A if overwrite else np.array(A, dtype=float)
+    rows, cols = R.shape
+    k = min(rows, cols)
+    V = np.zeros((rows, k))
+    tau = np.zeros(k)
+    for j in range(0, k, block_size):
+        end = min(j + block_size, k)
+        # R is already a copy, so the panel is factored where it is
+        panel_v, panel_tau, _ = househ_factor(R[j:, j:end], True)
+        V[j:, j:end] = panel_v
+        tau[j:end] = panel_tau
+        if end < cols:
+            T = househ_wy(panel_v, panel_tau)
+            trailing = R[j:, end:]
+            trailing -= np.dot(panel_v, np.dot(T.transpose(),
+                                              np.dot(panel_v.transpose(), trailing)))
+    return V, tau, R
 
-    r = math.hypot(xval, yval)
-    c = xval / r
-    s = yval / r
+def househ_wy(V, tau):
+    """
+    Input:
+        V: the reflector vectors of a panel
+        tau: the reflector scalars of a panel
 
-    I[i][i] = c
-    I[j][j] = c
-    I[j][i] = s
-    I[i][j] = -s
-    return I
+    Returns:
+        T: the upper triangular matrix of the compact WY representation, so
+        that H_0 H_1 ... H_k-1 = I - V * T * V.transpose()
+    """
+    k = len(tau)
+    T = np.zeros((k, k))
+    for i in range(k):
+        T[:i, i] = -tau[i] * np.dot(T[:i, :i], np.dot(V[:, :i].transpose(), V[:, i]))
+        T[i, i] = tau[i]
+    return T
 
-def househ_reflection(column):
+def househ_vector(column):
     """
     Input:
         column: a column of a matrix
 
     Returns:
-        H: the result of a householder reflection performed on the column
+        (v, tau, beta) the householder vector v (scaled so that v[0] = 1),
+        the scalar tau and the value beta such that
+        (I - tau * v * v.transpose()) * column = beta * e1
+    """
+    x = np.array(column, dtype=float)
+    v = x.copy()
+    v[0] = 1.0
+    sigma = np.dot(x[1:], x[1:])
+    if sigma == 0:
+        # the column is already in the right form, no reflection needed
+        return v, 0.0, x[0]
+    beta = -math.copysign(math.sqrt(x[0] ** 2 + sigma), x[0])
+    v[1:] = x[1:] / (x[0] - beta)
+    tau = (beta - x[0]) / beta
+    return v, tau, beta
+
+def househ_apply(V, tau, B, transpose=False, block_size=None):
+    """
+    Input:
+        V: the reflector vectors returned by househ_factor
+        tau: the reflector scalars returned by househ_factor
+        B: a matrix or vector to multiply, modified in place
+        transpose: apply q.transpose() instead of q
+        block_size: apply the reflectors block_size at a time in WY form
+
+    Returns:
+        q * B (or q.transpose() * B)
+    """
+    if block_size:
+        return househ_apply_blocked(V, tau, B, transpose, block_size)
+    order = range(len(tau))
+    if not transpose:
+        order = order[::-1]
+    for i in order:
+        if not tau[i]:
+            continue
+        v = V[i:, i]
+        block = B[i:]
+        block -= tau[i] * np.outer(v, np.dot(v, block)).reshape(block.shape)
+    return B
+
+def househ_apply_blocked(V, tau, B, transpose=False, block_size=BLOCK_SIZE):
+    """
+    Input:
+        V: the reflector vectors returned by househ_factor
+        tau: the reflector scalars returned by househ_factor
+        B: a matrix or vector to multiply, modified in place
+        transpose: apply q.transpose() instead of q
+        block_size: the number of reflectors applied per matrix product
+
+    Returns:
+        q * B (or q.transpose() * B)
+    """
+    starts = range(0, len(tau), block_size)
+    if not transpose:
+        starts = starts[::-1]
+    for j in starts:
+        end = min(j + block_size, len(tau))
+        panel_v = V[j:, j:end]
+        T = househ_wy(panel_v, tau[j:end])
+        if transpose:
+            T = T.transpose()
+        block = B[j:]
+        block -= np.dot(panel_v, np.dot(T, np.dot(panel_v.transpose(), block)))
+    return B
+
+def househ_q(V, tau, cols=None, block_size=None):
+    """
+    Input:
+        V: the reflector vectors returned by househ_factor
+        tau: the reflector scalars returned by househ_factor
+        cols: the number of columns of q to build, defaults to all of them
+        block_size: build q block_size reflectors at a time
+
+    Returns:
+        the first cols columns of q
+    """
+    rows = V.shape[0]
+    if cols is None:
+        cols = rows
+    return househ_apply(V, tau, np.eye(rows, cols), block_size=block_size)
+
+def qr_fact_givens(A, mode='full', rhs=None):
+    """
+    Input:
+        A: a matrix
+        mode: 'full' returns the square q, 'economic' returns the thin
+            rows x cols q and the cols x cols r, 'solve' never builds q and
+            returns (r, q.transpose() * rhs) instead
+        rhs: the vector (or matrix) to multiply by q.transpose() in 'solve'
+            mode
+
+    Returns:
+        (q, r) the qr factorization of A using givens rotations. In 'solve'
+        mode (r, qtb) as described in qr_fact_househ.
+    """
+    rotations, R = givens_factor(A)
+    rows, cols = R.shape
+    k = min(rows, cols)
+    if mode == 'solve':
+        qtb = np.array(rhs, dtype=float)
+        return R[:k], givens_apply(rotations, qtb, True)
+    if mode == 'economic':
+        return givens_q(rotations, rows, k), R[:k]
+    return givens_q(rotations, rows), R
+
+def givens_factor(A):
+    """
+    Input:
+        A: a matrix
+
+    Returns:
+        (rotations, R) where rotations is the list of (c, s, i, j) tuples
+        that were applied, in order, to rows i and j of A to produce the upper
+        triangular R. Entries that are already zero are skipped.
+    """
+    R = np.array(A, dtype=float)
+    rows, cols = R.shape
+    rotations = []
+    for i in range(min(rows - 1, cols)):
+        for j in np.flatnonzero(R[i + 1:, i]) + i + 1:
+            c, s = givens_coefficients(R[i, i], R[j, i])
+            rotate_rows(R, c, s, i, j, i)
+            R[j, i] = 0
+            rotations.append((c, s, i, j))
+    return rotations, R
+
+def givens_coefficients(x, y):
+    """
+    Input:
+        x: the value to rotate onto
+        y: the value to zero out
+
+    Returns:
+        (c, s) the cosine and sine of the rotation taking (x, y) to (r, 0)
     """
-    height = len(column)
-    v = add(column, norm(column) * np.eye(height, 1))
-    u = v / norm(v)
-    H = np.eye(height)  - 2 * u * u.transpose()
-    return H
+    r = math.hypot(x, y)
+    return x / r, y / r
 
-def norm(vector):
+def rotate_rows(B, c, s, i, j, start=0):
     """
-        Input:
-            vector:
+    Input:
+        B: a matrix or vector, modified in place
+        c, s: the cosine and sine of the rotation
+        i, j: the two rows to rotate
+        start: the first column to update, columns before it are left alone
+
+    Returns:
+        B with rows i and j rotated
+    """
+    rows = B[:, np.newaxis] if B.ndim == 1 else B
+    x = rows[i, start:].copy()
+    rows[i, start:] = c * x + s * rows[j, start:]
+    rows[j, start:] = c * rows[j, start:] - s * x
+    return B
+
+def givens_apply(rotations, B, transpose=False):
+    """
+    Input:
+        rotations: the (c, s, i, j) tuples returned by givens_factor
+        B: a matrix or vector to multiply, modified in place
+        transpose: apply q.transpose() instead of q
+
+    Returns:
+        q * B (or q.transpose() * B)
+    """
+    if transpose:
+        for c, s, i, j in rotations:
+            rotate_rows(B, c, s, i, j)
+    else:
+        for c, s, i, j in reversed(rotations):
+            rotate_rows(B, c, -s, i, j)
+    return B
+
+def givens_q(rotations, rows, cols=None):
+    """
+    Input:
+        rotations: the (c, s, i, j) tuples returned by givens_factor
+        rows: the number of rows of the factored matrix
+        cols: the number of columns of q to build, defaults to all of them
+
+    Returns:
+        the first cols columns of q
+    """
+    if cols is None:
+        cols = rows
+    return givens_apply(rotations, np.eye(rows, cols))
+
+def qr_solve(qr, A, rhs, overwrite=False):
+    """
+    Input:
+        qr: a qr factorization algorithm (function), either one taking
+            mode='solve' and rhs like qr_fact_househ and qr_fact_givens, or
+            one with the older contract q, r = qr(A) such as np.linalg.qr
+        A: the matrix to factor
+        rhs: the right hand side
+        overwrite: let qr factor A and multiply rhs in place if it can, as
+            qr_fact_househ can. A and rhs may be overwritten either way.
+
+    Returns:
+        (R, qtb) the first min(rows, cols) rows of r and q.transpose() * rhs,
+        as returned by qr(A, mode='solve', rhs=rhs). When qr returns a thin q
+        the entries of qtb past the first cols are unknown, they are replaced
+        by the norm of the rest of rhs followed by zeros, which keeps the norm
+        of the tail equal to the least squares residual.
+    """
+    if takes_argument(qr, 'rhs'):
+        if overwrite and takes_argument(qr, 'overwrite'):
+            return qr(A, mode='solve', rhs=rhs, overwrite=True)
+        return qr(A, mode='solve', rhs=rhs)
+    q, r = qr(A)
+    k = min(A.shape)
+    qtb = np.dot(np.transpose(q), rhs)
+    rows = A.shape[0]
+    if q.shape[1] < rows:
+        rest = np.linalg.norm(rhs - np.dot(q, qtb), axis=0)
+        tail = np.zeros((rows - q.shape[1],) + qtb.shape[1:])
+        tail[0] = rest
+        qtb = np.concatenate([qtb, tail])
+    return r[:k], qtb
+
+def takes_argument(function, name):
+    """
+    Input:
+        function: a function, such as a qr factorization algorithm
+        name: the name of an argument
+
+    Returns:
+        True if function takes an argument called name. A qr function taking
+        rhs, like qr_fact_househ and qr_fact_givens, can be called in 'solve'
+        mode. Other qr functions, including np.linalg.qr and scipy.linalg.qr
+        whose mode means something else, have the older q, r = qr(A)
+        contract.
+    """
+    try:
+        spec = inspect.getargspec(function)
+    except TypeError:
+        # not a plain python function
+        return False
+    return name in spec.args
+
+def qr_append_rows(R, qtb, A, b, qr=qr_fact_househ):
+    """
+    Folds new rows into an existing least squares factorization, so a tall
+    system can be factored a block of rows at a time in constant memory.
+
+    Input:
+        R: the upper triangular factor so far, None before the first block
+        qtb: q.transpose() * rhs so far (only the first len(R) entries)
+        A: the new rows of the matrix
+        b: the new entries of the right hand side
+        qr: the qr factorization algorithm to use (function)
+
+    Returns:
+        (R, qtb) the factorization of all of the rows seen so far
+    """
+    if R is not None:
+        A = np.vstack([R, A])
+        b = np.concatenate([qtb, b])
+    R, qtb = qr_solve(qr, A, b)
+    return R, qtb[:R.shape[0]]
+
+def givens_append_rows(R, qtb, A, b):
+    """
+    Folds new rows into an existing least squares factorization with givens
+    rotations. Each new row is rotated into R one column at a time, so k new
+    rows cost O(k n^2) however many rows went into R before.
+
+    Input:
+        R: the n x n upper triangular factor so far
+        qtb: q.transpose() * rhs so far (only the first n entries)
+        A: the k new rows of the matrix
+        b: the k new entries of the right hand side
 
-        Returns:
-            the euclidean norm of the vector
+    Returns:
+        (R, qtb, rest) the factorization of all of the rows seen so far and
+        the k entries of the rotated right hand side left below R. The
+        squared norm of rest is how much the new rows add to the least squares
+        residual.
     """
-    _sum = math.fsum([math.pow(x, 2) for x in vector])
-    return math.sqrt(_sum)
+    n = R.shape[0]
+    W = np.vstack([R, A]).astype(float)
+    rhs = np.concatenate([qtb, b]).astype(float)
+    for j in range(n, len(W)):
+        for i in range(n):
+            if W[j, i] != 0:
+                c, s = givens_coefficients(W[i, i], W[j, i])
+                rotate_rows(W, c, s, i, j, start=i)
+                rotate_rows(rhs, c, s, i, j)
+    return W[:n], rhs[:n], rhs[n:]
 
-def add(a, b):
+def back_substitute(R, b, block_size=None, tolerance=PIVOT_TOLERANCE):
     """
-    Why can't I just add two vectors??
-        Input:
-            a: a vector of size n
-            b: another vector of size n
+    Input:
+        R: an n x n upper triangular matrix
+        b: a vector of size n (or an n x k matrix of right hand sides)
+        block_size: solve block_size rows at a time, the rows above each
+            block are updated with a single matrix product
+        tolerance: pivots smaller than tolerance times the largest pivot
+            raise a LinAlgError
 
-        Returns:
-            a vector sum of the two vectors
+    Returns:
+        x: the solution to Rx = b
     """
-    return np.array([x + y for x, y in zip(a, b)])
+    n = R.shape[0]
+    pivots = np.abs(np.diagonal(R))
+    if n and pivots.min() <= tolerance * pivots.max():
+        raise np.linalg.LinAlgError(
+            'R is singular to working precision (pivot {} of {})'.format(
+                pivots.argmin(), n))
+
+    x = np.array(b, dtype=float)
+    if block_size:
+        for end in range(n, 0, -block_size):
+            start = max(end - block_size, 0)
+            x[start:end] -= np.dot(R[start:end, end:], x[end:])
+            x[start:end] = back_substitute(R[start:end, start:end], x[start:end],
+                                           tolerance=0)
+        return x
+    for i in range(n - 1, -1, -1):
+        x[i] = (x[i] - np.dot(R[i, i + 1:], x[i + 1:])) / R[i, i]
+    return x
 
-def embed(matrix, minor):
+def qr_solve_batch(A, b):
     """
-        Input:
-            matrix: The identity matrix to embed the minor into
-            minor: The smaller matrix that we want to embed
+    Householder qr of a whole stack of matrices at once, in 'solve' mode.
+    Each column step is vectorized across the stack.
 
-        Returns:
-            The matrix that was passed in with the values modified to be the values
-            of the embeded matrix
+    Input:
+        A: an N x rows x cols array of matrices
+        b: an N x rows array of right hand sides
+
+    Returns:
+        (R, qtb) the N x cols x cols upper triangular factors and the first
+        cols entries of q.transpose() * b for every matrix
     """
-    R, C = matrix.shape
-    r, c = minor.shape
+    R = np.array(A, dtype=float)
+    qtb = np.array(b, dtype=float)
+    N, rows, cols = R.shape
+    k = min(rows, cols)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(k):
+            x = R[:, i:, i]
+            alpha = x[:, 0]
+            sigma = np.einsum('ij,ij->i', x[:, 1:], x[:, 1:])
+            beta = -np.copysign(np.sqrt(alpha ** 2 + sigma), alpha)
+            # columns that are already in the right form get tau = 0
+            trivial = sigma == 0
+            v = x.copy()
+            v[:, 0] = 1
+            v[:, 1:] /= np.where(trivial, 1, alpha - beta)[:, np.newaxis]
+            tau = np.where(trivial, 0, (beta - alpha) / beta)
 
-    # Due to the way that I am doing the mapping from the smaller matrix to the larger
-    # matrix the elements are reversed both horizontally and vertically, the easy way to
-    # fix this is just to reverse the minor matrix then perform the mapping.
-    minor = np.flipud(np.fliplr(minor))
-    for x in range(r):
-        for y in range(c):
-            matrix[R - x - 1][C - y - 1] = minor[x][y]
-    return matrix
+            trailing = R[:, i:, i + 1:]
+            trailing -= (tau[:, np.newaxis, np.newaxis] * v[:, :, np.newaxis] *
+                         np.einsum('ij,ijk->ik', v, trailing)[:, np.newaxis, :])
+            rhs = qtb[:, i:]
+            rhs -= (tau * np.einsum('ij,ij->i', v, rhs))[:, np.newaxis] * v
+            R[:, i, i] = np.where(trivial, alpha, beta)
+            R[:, i + 1:, i] = 0
+    return R[:, :k], qtb[:, :k]
+
+def back_substitute_batch(R, b):
+    """
+    Input:
+        R: an N x n x n array of upper triangular matrices
+        b: an N x n array of right hand sides
+
+    Returns:
+        x: the N x n solutions to Rx = b. Singular systems give inf or nan
+        entries instead of raising, so one bad system doesn't stop the rest
+    """
+    x = np.array(b, dtype=float)
+    n = R.shape[1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(n - 1, -1, -1):
+            x[:, i] -= np.einsum('ij,ij->i', R[:, i, i + 1:], x[:, i + 1:])
+            x[:, i] /= R[:, i, i]
+    return x
 
 if __name__ == '__main__':
     b = np.array([[1, 2, 1],
@@ -0,0 +1,121 @@
+import unittest
+import numpy as np
+from factorizations import *
+
+class FactorizationsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tolerance = 1e-10
+        self.A = np.array([[1, 2, 1],
+                           [2, 3, 2],
+                           [1, 2, 2],
+                           [4, -1, 3],
+                           [0, 5, 1]], dtype=float)
+
+    ### Householder Tests
+    def testHouseHolder(self):
+        q, r = qr_fact_househ(self.A)
+        self.assertEqual(q.shape, (5, 5))
+        self.checkFactorization(q, r, self.A)
+
+    def testHouseHolderEconomic(self):
+        q, r = qr_fact_househ(self.A, mode='economic')
+        self.assertEqual(q.shape, (5, 3))
+        self.assertEqual(r.shape, (3, 3))
+        self.checkFactorization(q, r, self.A)
+
+    def testHouseHolderBlocked(self):
+        A = np.random.RandomState(0).standard_normal((40, 25))
+        V, tau, r = househ_factor(A)
+        blocked_v, blocked_tau, blocked_r = househ_factor_blocked(A, 8)
+        self.assertTrue(np.allclose(r, blocked_r, atol=self.tolerance))
+        q, r = qr_fact_househ(A, block_size=8)
+        self.checkFactorization(q, r, A)
+
+    ### Tests Using Givens Rotations
+    def testGivens(self):
+        q, r = qr_fact_givens(self.A)
+        self.assertEqual(q.shape, (5, 5))
+        self.checkFactorization(q, r, self.A)
+
+    def testGivensSkipsZeros(self):
+        rotations, r = givens_factor(self.A)
+        # A[4][0] is already zero so column 0 only needs three rotations
+        self.assertEqual(len([t for t in rotations if t[2] == 0]), 3)
+
+    def testGivensApply(self):
+        rotations, r = givens_factor(self.A)
+        q, r = qr_fact_givens(self.A)
+        b = np.arange(5, dtype=float)
+        self.assertTrue(np.allclose(givens_apply(rotations, b.copy(), True),
+                                    np.dot(q.transpose(), b)))
+
+    ### Solve Mode Tests
+    def testSolveMode(self):
+        b = np.arange(5, dtype=float)
+        expected = np.linalg.lstsq(self.A, b, rcond=None)[0]
+        for qr in (qr_fact_househ, qr_fact_givens):
+            r, qtb = qr(self.A, mode='solve', rhs=b)
+            self.assertEqual(r.shape, (3, 3))
+            self.assertTrue(np.allclose(np.linalg.solve(r, qtb[:3]), expected))
+
+    def testSolveModeOverwrite(self):
+        b = np.arange(5, dtype=float)
+        expected_r, expected_qtb = qr_fact_househ(self.A, mode='solve', rhs=b)
+        for block_size in (None, 2):
+            A = self.A.copy()
+            rhs = b.copy()
+            r, qtb = qr_fact_househ(A, mode='solve', rhs=rhs, block_size=block_size,
+                                    overwrite=True)
+            # factored where they are, without copies
+            self.assertTrue(np.may_share_memory(r, A))
+            self.assertTrue(qtb is rhs)
+            self.assertTrue(np.allclose(r, expected_r))
+            self.assertTrue(np.allclose(qtb, expected_qtb))
+
+    def testAppendRows(self):
+        b = np.arange(5, dtype=float)
+        R, qtb = qr_append_rows(None, None, self.A[:2], b[:2])
+        R, qtb = qr_append_rows(R, qtb, self.A[2:], b[2:], qr_fact_givens)
+        expected = np.linalg.lstsq(self.A, b, rcond=None)[0]
+        self.assertTrue(np.allclose(back_substitute(R, qtb), expected))
+
+    def testGivensAppendRows(self):
+        b = np.array([1.0, -2.0, 0.5, 3.0, 1.0])
+        R, qtb = qr_fact_househ(self.A[:3], mode='solve', rhs=b[:3])
+        R, qtb, rest = givens_append_rows(R, qtb, self.A[3:], b[3:])
+        expected, residual = np.linalg.lstsq(self.A, b, rcond=None)[:2]
+        self.assertTrue(np.allclose(np.triu(R), R))
+        self.assertTrue(np.allclose(back_substitute(R, qtb), expected))
+        self.assertAlmostEqual(np.dot(rest, rest), residual[0])
+
+    def testSolveBatch(self):
+        random = np.random.RandomState(0)
+        A = random.standard_normal((10, 8, 3))
+        b = random.standard_normal((10, 8))
+        R, qtb = qr_solve_batch(A, b)
+        for x, A_i, b_i in zip(back_substitute_batch(R, qtb), A, b):
+            self.assertTrue(np.allclose(x, np.linalg.lstsq(A_i, b_i, rcond=None)[0]))
+
+    ### Back Substitution Tests
+    def testBackSubstitute(self):
+        random = np.random.RandomState(0)
+        R = np.triu(random.standard_normal((20, 20))) + 5 * np.eye(20)
+        b = random.standard_normal(20)
+        expected = np.linalg.solve(R, b)
+        self.assertTrue(np.allclose(back_substitute(R, b), expected))
+        self.assertTrue(np.allclose(back_substitute(R, b, block_size=6), expected))
+
+    def testBackSubstituteSingular(self):
+        R = np.triu(np.ones((4, 4)))
+        R[2, 2] = 1e-20
+        self.assertRaises(np.linalg.LinAlgError, back_substitute, R, np.ones(4))
+
+    def checkFactorization(self, q, r, A):
+        self.assertTrue(np.allclose(np.dot(q, r), A, atol=self.tolerance))
+        self.assertTrue(np.allclose(np.dot(q.transpose(), q),
+                                    np.eye(q.shape[1]), atol=self.tolerance))
+        self.assertTrue(np.allclose(np.tril(r, -1), 0, atol=self.tolerance))
+
+if __name__ == '__main__':
+    unittest.main()
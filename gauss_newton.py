@@ -1,17 +1,39 @@
 import math
+import inspect
 import numpy as np
+from collections import namedtuple
 from util import FileReader
-from factorizations import qr_fact_househ, qr_fact_givens
+from factorizations import qr_fact_househ, qr_fact_givens, back_substitute, \
+    qr_append_rows, qr_solve_batch, back_substitute_batch, qr_solve
+from profiler import NULL_PROFILER
 
-def gauss_newton(filename, initial_guess, iterations, qr, fit, partial):
+# A curve evaluated over every point at once.
+#   fit(B, xs): the values of the curve at each of the xs
+#   jacobian(B, xs): the jacobian of the residual vector with respect to B.
+#       The built in models also take out=, an array to write it into.
+Model = namedtuple('Model', ['fit', 'jacobian'])
+
+# give up on a levenberg-marquardt step once the damping grows past this
+MAX_DAMPING = 1e10
+
+# number of points held in memory at a time by gauss_newton_stream
+STREAM_BLOCK_SIZE = 65536
+
+def gauss_newton(filename, initial_guess, iterations, qr, fit, partial, profiler=None):
     """
     Input:
         filename: the name of the file containing the points
         initial_guess: the initial guesses for for the parameters a, b, and c
         iterations: number of iterations to run the gauss-newton algorithm
-        qr: the qr factorization algorithm to use (function)
-        fit: the curve to approximate (function)
-        partial: the partial derivative of the curve (function)
+        qr: the qr factorization algorithm to use (function), it is called
+            as qr(J, mode='solve', rhs=r) so q is never formed. A function
+            without a mode argument is called as q, r = qr(J) instead.
+        fit: the curve to approximate (function or Model)
+        partial: the partial derivative of the curve (function), unused when
+            fit is a Model
+        profiler: optional Profiler recording the time spent in the
+            residual, jacobian, qr and solve phases of every iteration along
+            with the residual norm and step size
 
     Returns:
         the parameters giving the best approximation for the appropriate curve
@@ -20,59 +42,433 @@ def gauss_newton(filename, initial_guess, iterations, qr, fit, partial):
 
     # Read in the file and initialize the vector B, the residual vector, and the Jacobian
     points = FileReader().vectorize(filename)
-    B = np.array(initial_guess)
-    r = residuals(B, points, fit)
-    J = jacobian(B , points, partial)
+    model = as_model(fit, partial)
+    B = np.array(initial_guess, dtype=float)
+    r = residuals(B, points, model)
+    J = jacobian(B, points, model)
+    enabled = profiler is not None
+    profiler = profiler or NULL_PROFILER
 
     # Perform the necessary iterations
     for i in range(iterations):
-        Q, R = qr(J)
-        b = np.dot(Q.transpose(), r)
-        x = solve(R, b)
-        B = B - x
-        r = residuals(B, points, fit)
-        J = jacobian(B, points, partial)
+        with profiler.span('qr', i):
+            R, b = qr_solve(qr, J, r)
+        with profiler.span('solve', i):
+            step = solve(R, b)
+        B = B - step
+        with profiler.span('residual', i):
+            r = residuals(B, points, model)
+        with profiler.span('jacobian', i):
+            J = jacobian(B, points, model)
+        if enabled:
+            profiler.metric('step', i, norm(step))
+            profiler.metric('residual_norm', i, norm(r))
+    return B
+
+def gauss_newton_stream(filename, initial_guess, iterations, qr, fit,
+                        partial=None, block_size=STREAM_BLOCK_SIZE):
+    """
+    Runs gauss-newton without ever holding all of the points in memory. Each
+    iteration streams the file a block of points at a time and folds the
+    block's jacobian rows and residuals into a running n x n R and
+    q.transpose() * r, so memory doesn't grow with the number of points.
+
+    Input:
+        filename: the name of the file containing the points
+        initial_guess: the initial guesses for the parameters
+        iterations: number of iterations to run the gauss-newton algorithm
+        qr: the qr factorization algorithm to use (function)
+        fit: the curve to approximate (function or Model)
+        partial: the partial derivative of the curve (function)
+        block_size: the number of points read in at a time
+
+    Returns:
+        the parameters giving the best approximation for the appropriate curve
+        matching the given points
+
+    Raises:
+        ValueError if the file holds no points
+    """
+    reader = FileReader()
+    model = as_model(fit, partial)
+    B = np.array(initial_guess, dtype=float)
+    for i in range(iterations):
+        R, qtr = None, None
+        for points in reader.blocks(filename, block_size):
+            R, qtr = qr_append_rows(R, qtr, jacobian(B, points, model),
+                                    residuals(B, points, model), qr)
+        if R is None:
+            raise ValueError('No points in file {}'.format(filename))
+        B = B - solve(R, qtr)
     return B
 
-def residuals(B, points, curve):
+def gauss_newton_converge(points, initial_guess, qr, fit, partial=None,
+                          max_iterations=100, step_tolerance=1e-8,
+                          residual_tolerance=1e-10, gradient_tolerance=1e-10,
+                          damping=1e-3):
+    """
+    Runs gauss-newton until the fit stops changing instead of for a fixed
+    number of iterations. Each step is damped levenberg-marquardt style: if a
+    step doesn't reduce the residual the damping is increased and the step is
+    retried, otherwise the damping is decreased for the next step.
+
+    Input:
+        points: a filename or an array of (x, y) points
+        initial_guess: the initial guesses for the parameters
+        qr: the qr factorization algorithm to use (function)
+        fit: the curve to approximate (function or Model)
+        partial: the partial derivative of the curve (function)
+        max_iterations: the most steps to take before giving up
+        step_tolerance: stop once the step is this small relative to B
+        residual_tolerance: stop once the norm of the residual is this small
+        gradient_tolerance: stop once every entry of the gradient of the
+            residual sum of squares is this small
+        damping: the initial levenberg-marquardt damping, 0 for plain
+            (undamped) gauss-newton steps
+
+    Returns:
+        {
+        params: the parameters giving the best approximation
+        iterations: the number of steps taken
+        residual: the norm of the final residual vector
+        reason: why the solver stopped, one of 'residual', 'gradient', 'step',
+            'damping' or 'max_iterations'
+        }
+    """
+    points = load_points(points)
+    model = as_model(fit, partial)
+    B = np.array(initial_guess, dtype=float)
+    r = residuals(B, points, model)
+    cost = np.dot(r, r)
+    iterations = 0
+    reason = 'max_iterations'
+
+    while iterations < max_iterations:
+        if math.sqrt(cost) <= residual_tolerance:
+            reason = 'residual'
+            break
+        J = jacobian(B, points, model)
+        if np.max(np.abs(np.dot(J.transpose(), r))) <= gradient_tolerance:
+            reason = 'gradient'
+            break
+
+        iterations += 1
+        x = least_squares_step(J, r, qr, damping)
+        candidate = B - x
+        candidate_r = residuals(candidate, points, model)
+        candidate_cost = np.dot(candidate_r, candidate_r)
+
+        # retry with more damping until the step actually reduces the residual.
+        # A step that leaves it unchanged is taken too, at the noise floor
+        # there is nothing left to reduce.
+        while damping and not candidate_cost <= cost:
+            damping *= 10
+            if damping > MAX_DAMPING:
+                break
+            x = least_squares_step(J, r, qr, damping)
+            candidate = B - x
+            candidate_r = residuals(candidate, points, model)
+            candidate_cost = np.dot(candidate_r, candidate_r)
+        if damping > MAX_DAMPING:
+            reason = 'damping'
+            break
+
+        B, r, cost = candidate, candidate_r, candidate_cost
+        damping /= 10
+        if norm(x) <= step_tolerance * (norm(B) + step_tolerance):
+            reason = 'step'
+            break
+
+    return {
+        'params': B,
+        'iterations': iterations,
+        'residual': math.sqrt(cost),
+        'reason': reason
+    }
+
+def gauss_newton_batch(datasets, initial_guesses, fit, partial=None,
+                       max_iterations=100, step_tolerance=1e-8,
+                       residual_tolerance=1e-10, damping=1e-3):
+    """
+    Fits the same curve to many independent datasets at once. The jacobians
+    of every fit are stacked into one 3-D array so each iteration is a single
+    batched qr and back substitution rather than one per dataset. Each fit is
+    damped like gauss_newton_converge and is masked out once it converges.
+
+    Input:
+        datasets: a list of filenames or arrays of (x, y) points, they don't
+            need to be the same length
+        initial_guesses: one initial guess for every dataset, or a list of
+            guesses with one per dataset
+        fit: the curve to approximate (function or Model). Its fit and
+            jacobian have to broadcast over a leading batch axis, as the
+            QUADRATIC, EXPONENTIAL, LOGARITHMIC and RATIONAL models do
+        partial: the partial derivative of the curve (function)
+        max_iterations: the most steps to take before giving up
+        step_tolerance: a fit stops once its step is this small relative to B
+        residual_tolerance: a fit stops once its residual norm is this small
+        damping: the initial levenberg-marquardt damping, 0 for plain steps
+
+    Returns:
+        {
+        params: N x n array of the fitted parameters
+        iterations: array of the number of steps each fit took
+        residual: array of the norms of the final residual vectors
+        converged: boolean array, False where a fit ran out of iterations or
+            couldn't make progress
+        }
+    """
+    model = as_model(fit, partial)
+    xs, ys, mask = stack_points([load_points(d) for d in datasets])
+    N = len(xs)
+    B = np.array(np.broadcast_to(np.asarray(initial_guesses, dtype=float),
+                                 (N, np.shape(initial_guesses)[-1])))
+    lam = np.full(N, float(damping))
+    r = batch_residuals(B, xs, ys, mask, model)
+    cost = np.einsum('ij,ij->i', r, r)
+    iterations = np.zeros(N, dtype=int)
+    converged = np.sqrt(cost) <= residual_tolerance
+
+    active = np.flatnonzero(~converged)
+    for iteration in range(1, max_iterations + 1):
+        if not len(active):
+            break
+        J = batch_jacobian(B[active], xs[active], mask[active], model)
+        x = batch_step(J, r[active], lam[active])
+        candidate = B[active] - x
+        candidate_r = batch_residuals(candidate, xs[active], ys[active],
+                                      mask[active], model)
+        candidate_cost = np.einsum('ij,ij->i', candidate_r, candidate_r)
+
+        improved = candidate_cost <= cost[active]
+        if not damping:
+            improved[:] = np.isfinite(candidate_cost)
+        accepted = active[improved]
+        B[accepted] = candidate[improved]
+        r[accepted] = candidate_r[improved]
+        cost[accepted] = candidate_cost[improved]
+        lam[accepted] /= 10
+        lam[active[~improved]] *= 10
+        iterations[active] = iteration
+
+        step = np.sqrt(np.einsum('ij,ij->i', x, x))
+        size = np.sqrt(np.einsum('ij,ij->i', B[active], B[active]))
+        done = improved & ((step <= step_tolerance * (size + step_tolerance)) |
+                           (np.sqrt(cost[active]) <= residual_tolerance))
+        converged[active[done]] = True
+        stuck = (lam[active] > MAX_DAMPING) | ~np.isfinite(cost[active])
+        active = active[~(done | stuck)]
+
+    return {
+        'params': B,
+        'iterations': iterations,
+        'residual': np.sqrt(cost),
+        'converged': converged
+    }
+
+def stack_points(points):
+    """
+    Input:
+        points: a list of arrays of (x, y) points of any length
+
+    Returns:
+        (xs, ys, mask) N x m arrays padded to the longest dataset. Padding
+        repeats the last point of each dataset and is False in mask.
+    """
+    m = max(len(p) for p in points)
+    xs = np.empty((len(points), m))
+    ys = np.zeros((len(points), m))
+    mask = np.zeros((len(points), m), dtype=bool)
+    for i, p in enumerate(points):
+        xs[i, :len(p)] = p[:, 0]
+        xs[i, len(p):] = p[-1, 0]
+        ys[i, :len(p)] = p[:, 1]
+        mask[i, :len(p)] = True
+    return xs, ys, mask
+
+def batch_residuals(B, xs, ys, mask, model):
+    """
+    Input:
+        B: N x n array of parameters, one row per dataset
+        xs, ys, mask: the stacked points from stack_points
+        model: the Model used to construct the residuals
+
+    Returns:
+        N x m array of residuals, zero on the padding
+    """
+    with np.errstate(all='ignore'):
+        r = ys - model.fit(B.transpose()[:, :, np.newaxis], xs)
+    return np.where(mask, r, 0)
+
+def batch_jacobian(B, xs, mask, model):
+    """
+    Input:
+        B: N x n array of parameters, one row per dataset
+        xs, mask: the stacked points from stack_points
+        model: the Model used to construct the jacobians
+
+    Returns:
+        N x m x n array of jacobians, zero on the padding
+    """
+    with np.errstate(all='ignore'):
+        J = model.jacobian(B.transpose()[:, :, np.newaxis], xs)
+    J = np.broadcast_to(J, xs.shape + (B.shape[1],))
+    return np.where(mask[:, :, np.newaxis], J, 0)
+
+def batch_step(J, r, damping):
+    """
+    Input:
+        J: N x m x n array of jacobians
+        r: N x m array of residuals
+        damping: array of the levenberg-marquardt damping of each fit
+
+    Returns:
+        N x n array of the steps to subtract from each B
+    """
+    N, m, n = J.shape
+    J = np.concatenate([J, np.sqrt(damping)[:, np.newaxis, np.newaxis] * np.eye(n)], axis=1)
+    r = np.concatenate([r, np.zeros((N, n))], axis=1)
+    R, qtr = qr_solve_batch(J, r)
+    return back_substitute_batch(R, qtr)
+
+def least_squares_step(J, r, qr, damping=0):
+    """
+    Input:
+        J: the jacobian
+        r: the residual vector
+        qr: the qr factorization algorithm to use (function)
+        damping: levenberg-marquardt damping, the step minimizes
+            |J x - r|^2 + damping * |x|^2
+
+    Returns:
+        x: the step to subtract from B
+    """
+    if damping:
+        cols = J.shape[1]
+        J = np.vstack([J, math.sqrt(damping) * np.eye(cols)])
+        r = np.concatenate([r, np.zeros(cols)])
+    R, b = qr_solve(qr, J, r)
+    return solve(R, b)
+
+def load_points(source):
+    """
+    Input:
+        source: the name of a file containing the points, or the points
+            themselves as an array of (x, y) pairs
+
+    Returns:
+        the points as an array
+    """
+    if isinstance(source, basestring):
+        return FileReader().vectorize(source)
+    return np.asarray(source, dtype=float)
+
+def norm(vector):
+    """
+    Input:
+        vector: a vector
+
+    Returns:
+        the euclidean norm of the vector
+    """
+    return math.sqrt(np.dot(vector, vector))
+
+def residuals(B, points, model):
     """
     Input:
         B: vector (a, b , c)
         points: the points used to construct the residual
-        curve: the curve used to construct the residual
+        model: the Model used to construct the residual
     
     Returns:
         the residual vector
 
     """
-    return np.array([y - curve(B, x) for x, y in points])
+    return points[:, 1] - model.fit(B, points[:, 0])
 
-def jacobian(B, points, partial):
+def jacobian(B, points, model, out=None):
     """
     Input:
         B: vector (a, b, c)
         points: the points that are loaded from the file
-        partial: the partial used to construct the jacobian
+        model: the Model used to construct the jacobian
+        out: an array to write the jacobian into. Models whose jacobian
+            doesn't take out have theirs copied into it.
 
     Returns:
         The jacobian formed by the inputs
     """
-    j = [[partial(B, index, p[0]) for index in range(len(B))] for p in points]
-    return np.array(j)
+    xs = points[:, 0]
+    if out is None:
+        return model.jacobian(B, xs)
+    if writes_out(model.jacobian):
+        return model.jacobian(B, xs, out=out)
+    out[...] = model.jacobian(B, xs)
+    return out
+
+def writes_out(function):
+    """
+    Input:
+        function: the jacobian of a Model
+
+    Returns:
+        True if the function takes an out argument to write its result into
+    """
+    try:
+        return 'out' in inspect.getargspec(function).args
+    except TypeError:
+        return False
+
+def as_model(fit, partial=None):
+    """
+    Input:
+        fit: a Model, a scalar curve function fit(B, x) or an expression
+            string such as 'a*exp(b*x)+c' (see expressions.compile_model)
+        partial: the scalar partial function partial(B, index, x) of the curve
+
+    Returns:
+        the vectorized Model for the curve. The built in curves map to their
+        array valued versions, any other scalar pair is wrapped by scalar_model
+    """
+    if isinstance(fit, Model):
+        return fit
+    if isinstance(fit, basestring):
+        # imported here since expressions builds on this module
+        from expressions import compile_model
+        return compile_model(fit)
+    if fit in MODELS:
+        return MODELS[fit]
+    return scalar_model(fit, partial)
+
+def scalar_model(fit, partial):
+    """
+    Input:
+        fit: a scalar curve function fit(B, x)
+        partial: the scalar partial function partial(B, index, x)
+
+    Returns:
+        a Model that evaluates the scalar functions one point at a time, for
+        curves that don't have an array valued version
+    """
+    def fit_all(B, xs):
+        return np.array([fit(B, x) for x in xs])
+
+    def jacobian_all(B, xs):
+        return np.array([[partial(B, index, x) for index in range(len(B))]
+                         for x in xs])
+
+    return Model(fit_all, jacobian_all)
 
 def solve(A, b):
     """
         Input:
-            A: a matrix
+            A: an n x n upper triangular matrix
             b: the vector to solve for
 
         Returns:
             x: the solution to Ax = b
     """
-    z = b[2] / A[2][2]
-    y = (b[1] - (z * A[1][2])) / A[1][1]
-    x = (b[0] - (z * A[0][2]) - (y * A[0][1])) / A[0][0]
-    return x , y, z
+    return back_substitute(A, b[:A.shape[0]])
 
 def quadratic_fit(B, x):
     """
@@ -105,6 +501,35 @@ def quadratic_partial(B, index, value):
     if index == 2:
         return -1
 
+def quadratic_curve(B, xs):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+
+    Returns:
+        the quadratic fit B(x) at every x
+    """
+    a, b, c = B
+    return a * xs ** 2 + b * xs + c
+
+def quadratic_jacobian(B, xs, out=None):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+        out: an array to write the jacobian into
+
+    Returns:
+        the jacobian of the quadratic residual, one row per x
+    """
+    if out is None:
+        return -np.stack([xs ** 2, xs, np.ones_like(xs)], axis=-1)
+    np.square(xs, out=out[..., 0])
+    out[..., 1] = xs
+    out[..., 2] = 1
+    return np.negative(out, out=out)
+
 def exponential_fit(B, x):
     """
     Input:
@@ -138,6 +563,40 @@ def exponential_partial(B, index, x):
     if index == 2:
         return -1 
 
+def exponential_curve(B, xs):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+
+    Returns:
+        the exponential fit B(x) at every x
+    """
+    a, b, c = B
+    return a * np.exp(b * xs) + c
+
+def exponential_jacobian(B, xs, out=None):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+        out: an array to write the jacobian into
+
+    Returns:
+        the jacobian of the exponential residual, one row per x
+    """
+    a, b, c = B
+    if out is None:
+        e = np.exp(b * xs)
+        return -np.stack([e, xs * a * e, np.ones_like(e)], axis=-1)
+    e = out[..., 0]
+    np.multiply(xs, b, out=e)
+    np.exp(e, out=e)
+    np.multiply(xs, e, out=out[..., 1])
+    out[..., 1] *= a
+    out[..., 2] = 1
+    return np.negative(out, out=out)
+
 def logarithmic_fit(B, x):
     """
     Input:
@@ -151,14 +610,57 @@ def logarithmic_fit(B, x):
     return a * math.log(x + b) + c
 
 def logarithmic_partial(B, index, x):
+    """
+     Input:
+        B: vector (a, b ,c)
+        index: the index of B that is passed in, used to artificially
+            construct the partial derivative
+        value:
+
+    Returns:
+        the partial of r with respect to B index
+    """
     a, b , c = B
     if index == 0:
         return -math.log(x + b)
     if index == 1:
-        return -a / math.log(x + b)
+        return -a / (x + b)
     if index == 2:
         return -1
 
+def logarithmic_curve(B, xs):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+
+    Returns:
+        the logarithmic fit B(x) at every x
+    """
+    a, b, c = B
+    return a * np.log(xs + b) + c
+
+def logarithmic_jacobian(B, xs, out=None):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+        out: an array to write the jacobian into
+
+    Returns:
+        the jacobian of the logarithmic residual, one row per x
+    """
+    a, b, c = B
+    if out is None:
+        shifted = xs + b
+        return -np.stack([np.log(shifted), a / shifted, np.ones_like(shifted)], axis=-1)
+    shifted = out[..., 1]
+    np.add(xs, b, out=shifted)
+    np.log(shifted, out=out[..., 0])
+    np.divide(a, shifted, out=shifted)
+    out[..., 2] = 1
+    return np.negative(out, out=out)
+
 def rational_fit(B, x):
     """
     Input:
@@ -190,6 +692,85 @@ def rational_partial(B, index, x):
     if index == 2:
         return -1
 
+def rational_curve(B, xs):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+
+    Returns:
+        the rational fit B(x) at every x
+    """
+    a, b, c = B
+    return (a * xs) / (xs + b) + c
+
+def rational_jacobian(B, xs, out=None):
+    """
+    Input:
+        B: vector (a, b, c)
+        xs: an array of values
+        out: an array to write the jacobian into
+
+    Returns:
+        the jacobian of the rational residual, one row per x
+    """
+    a, b, c = B
+    if out is None:
+        shifted = xs + b
+        return np.stack([-xs / shifted, (a * xs) / shifted ** 2,
+                         -np.ones_like(shifted)], axis=-1)
+    # column 1 is a * x / (x + b)^2, which is -a times column 0 over x + b
+    shifted = out[..., 1]
+    np.add(xs, b, out=shifted)
+    np.divide(xs, shifted, out=out[..., 0])
+    np.negative(out[..., 0], out=out[..., 0])
+    np.divide(out[..., 0], shifted, out=shifted)
+    shifted *= -a
+    out[..., 2] = -1
+    return out
+
+def polynomial_model(degree):
+    """
+    Input:
+        degree: the degree of the polynomial
+
+    Returns:
+        a Model for the polynomial B[0] x^degree + ... + B[degree], which
+        takes degree + 1 parameters
+    """
+    def fit(B, xs):
+        return np.polyval(B, xs)
+
+    def polynomial_jacobian(B, xs, out=None):
+        if out is None:
+            return -np.vander(xs, degree + 1)
+        # the powers of x from the last column to the first
+        out[:, degree] = -1
+        for column in range(degree - 1, -1, -1):
+            np.multiply(out[:, column + 1], xs, out=out[:, column])
+        return out
+
+    return Model(fit, polynomial_jacobian)
+
+QUADRATIC = Model(quadratic_curve, quadratic_jacobian)
+EXPONENTIAL = Model(exponential_curve, exponential_jacobian)
+LOGARITHMIC = Model(logarithmic_curve, logarithmic_jacobian)
+RATIONAL = Model(rational_curve, rational_jacobian)
+
+# the array valued model to use for each of the scalar curves
+MODELS = {
+    quadratic_fit: QUADRATIC,
+    exponential_fit: EXPONENTIAL,
+    logarithmic_fit: LOGARITHMIC,
+    rational_fit: RATIONAL
+}
+
+# the named curves offered by main and batch, in menu order
+CURVES = [('quadratic', QUADRATIC),
+          ('exponential', EXPONENTIAL),
+          ('logarithmic', LOGARITHMIC),
+          ('rational', RATIONAL)]
+
 if __name__ == '__main__':
     a = gauss_newton('quadratic.txt', (1, 3, -1), 5, 
                      qr_fact_househ, quadratic_fit, quadratic_partial)
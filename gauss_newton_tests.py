@@ -1,5 +1,9 @@
+import os
+import shutil
+import tempfile
 import unittest
 from gauss_newton import *
+from util import FileReader
 from factorizations import *
 from main import *
 import math
@@ -65,11 +69,168 @@ class GaussNewtonTests(unittest.TestCase):
         print result
         self.checkAccuracy(result, (0.35, 0.85, 0.038))
 
+    ### Old qr contract Tests
+    def testQrWithoutMode(self):
+        # qr functions that only return q and r, thin or square, still work
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'quadratic.txt')
+            points = self.makePoints(quadratic_fit, (0.16, 2.0, 0.85))
+            points[:, 1] += 0.01 * np.random.RandomState(0).standard_normal(len(points))
+            np.savetxt(filename, points, delimiter=',')
+            expected = gauss_newton(filename, (1, 3, -1), 5, qr_fact_househ, quadratic_fit,
+                                    quadratic_partial)
+            J = jacobian(np.array((1., 3., -1.)), points, QUADRATIC)
+            r = residuals(np.array((1., 3., -1.)), points, QUADRATIC)
+            R, qtr = qr_fact_househ(J, mode='solve', rhs=r)
+            for qr in (np.linalg.qr, lambda A: np.linalg.qr(A, mode='complete')):
+                result = gauss_newton(filename, (1, 3, -1), 5, qr, quadratic_fit,
+                                      quadratic_partial)
+                self.assertTrue(np.allclose(result, expected))
+                for damping in (0, 1e-2):
+                    self.assertTrue(np.allclose(least_squares_step(J, r, qr, damping),
+                                                least_squares_step(J, r, qr_fact_househ,
+                                                                   damping)))
+                R_qr, qtr_qr = qr_solve(qr, J, r)
+                self.assertEqual(qtr_qr.shape, qtr.shape)
+                self.assertAlmostEqual(np.linalg.norm(qtr_qr[3:]), np.linalg.norm(qtr[3:]))
+                converged = gauss_newton_converge(points, (1, 3, -1), qr, QUADRATIC)
+                self.assertTrue(np.allclose(converged['params'], expected, atol=1e-6))
+        finally:
+            shutil.rmtree(directory)
+
+    ### Vectorized Model Tests
+    def testModelsMatchScalarCurves(self):
+        xs = np.linspace(1, 5, 7)
+        points = np.column_stack([xs, 2 * xs])
+        curves = [(quadratic_fit, quadratic_partial, (1, 3, -1)),
+                  (exponential_fit, exponential_partial, (-0.3, 0.3, 0.3)),
+                  (logarithmic_fit, logarithmic_partial, (-2, 10, 5)),
+                  (rational_fit, rational_partial, (0.9, 0.2, 0.1))]
+        for fit, partial, B in curves:
+            model = as_model(fit, partial)
+            self.assertTrue(model is MODELS[fit])
+            scalar = scalar_model(fit, partial)
+            self.assertTrue(np.allclose(residuals(B, points, model),
+                                        residuals(B, points, scalar)))
+            self.assertTrue(np.allclose(jacobian(B, points, model),
+                                        jacobian(B, points, scalar)))
+            out = np.empty((len(points), 3))
+            self.assertTrue(jacobian(B, points, model, out=out) is out)
+            self.assertTrue(np.allclose(out, jacobian(B, points, scalar)))
+
+    ### Convergence Tests
+    def testConvergeStopsEarly(self):
+        points = self.makePoints(quadratic_fit, (0.16, 2.0, 0.85))
+        result = gauss_newton_converge(points, (1, 3, -1), qr_fact_househ,
+                                       quadratic_fit, quadratic_partial)
+        self.checkAccuracy(result['params'], (0.16, 2.0, 0.85))
+        self.assertTrue(result['iterations'] < 10)
+        self.assertTrue(result['reason'] in ('residual', 'gradient', 'step'))
+
+    def testConvergeDamping(self):
+        points = self.makePoints(exponential_fit, (-0.2, 0.5, -0.07))
+        result = gauss_newton_converge(points, (-0.3, 0.3, 0.3), qr_fact_househ,
+                                       exponential_fit, exponential_partial)
+        self.checkAccuracy(result['params'], (-0.2, 0.5, -0.07))
+        self.assertTrue(result['residual'] < 1e-6)
+
+    def testConvergeNoiseFloor(self):
+        # restarted from a converged fit of noisy points the step leaves the
+        # residual exactly where it was, which has to count as progress
+        random = np.random.RandomState(0)
+        points = self.makePoints(quadratic_fit, (0.16, 2.0, 0.85))
+        points[:, 1] += 0.01 * random.standard_normal(len(points))
+        first = gauss_newton_converge(points, (1, 3, -1), qr_fact_househ, QUADRATIC,
+                                      gradient_tolerance=0)
+        again = gauss_newton_converge(points, first['params'], qr_fact_househ, QUADRATIC,
+                                      gradient_tolerance=0)
+        self.assertEqual(again['residual'], first['residual'])
+        self.assertEqual(again['reason'], 'step')
+        self.assertEqual(again['iterations'], 1)
+
+    def testConvergePolynomial(self):
+        xs = np.linspace(-1, 1, 50)
+        expected = (0.5, -1, 2, 0, 1, -3, 4)
+        points = np.column_stack([xs, np.polyval(expected, xs)])
+        result = gauss_newton_converge(points, np.zeros(7), qr_fact_househ,
+                                       polynomial_model(6))
+        self.checkAccuracy(result['params'], expected)
+
+    ### Batch Tests
+    def testBatch(self):
+        expected = [(-0.2, 0.5, -0.07), (-0.25, 0.45, 0.1), (-0.1, 0.55, 0)]
+        datasets = [self.makePoints(exponential_fit, B) for B in expected]
+        # datasets of different lengths are padded
+        datasets[1] = datasets[1][:25]
+        result = gauss_newton_batch(datasets, (-0.3, 0.3, 0.3), exponential_fit,
+                                    exponential_partial)
+        self.assertTrue(result['converged'].all())
+        self.assertTrue(np.allclose(result['params'], expected, atol=1e-6))
+        single = gauss_newton_converge(datasets[1], (-0.3, 0.3, 0.3), qr_fact_househ,
+                                       EXPONENTIAL)
+        self.assertTrue(np.allclose(result['params'][1], single['params']))
+
+    def makePoints(self, fit, B):
+        xs = np.linspace(1, 10, 40)
+        return np.column_stack([xs, MODELS[fit].fit(np.array(B), xs)])
+
     def checkAccuracy(self, output, expected):
         print 'expected {} got {}'.format(expected, output)
         for r , e in zip(output, expected):
             difference = abs(r) - abs(e)
             self.assertTrue(abs(difference) < self.tolerance)
 
+class StreamTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        random = np.random.RandomState(0)
+        xs = np.linspace(1, 10, 100)
+        noise = 0.01 * random.standard_normal(len(xs))
+        self.files = {}
+        for name, B in (('quadratic', (0.16, 2.0, 0.85)), ('rational', (0.35, 0.85, 0.038))):
+            model = dict(CURVES)[name]
+            filename = os.path.join(self.directory, name + '.txt')
+            with open(filename, 'w') as points_file:
+                for x, y in zip(xs, model.fit(np.array(B), xs) + noise):
+                    points_file.write('{!r},{!r}\n'.format(x, y))
+            self.files[name] = filename
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testQuadraticStream(self):
+        filename = self.files['quadratic']
+        result = gauss_newton_stream(filename, (1, 3, -1), 5, qr_fact_househ,
+                                     quadratic_fit, quadratic_partial, block_size=7)
+        expected = gauss_newton(filename, (1, 3, -1), 5, qr_fact_househ,
+                                quadratic_fit, quadratic_partial)
+        self.assertTrue(np.allclose(result, expected))
+        self.assertTrue(np.allclose(result, (0.16, 2.0, 0.85), atol=0.05))
+
+    def testRationalStream(self):
+        filename = self.files['rational']
+        result = gauss_newton_stream(filename, (0.9, 0.2, 0.1), 5, qr_fact_givens,
+                                     rational_fit, rational_partial, block_size=7)
+        expected = gauss_newton(filename, (0.9, 0.2, 0.1), 5, qr_fact_givens,
+                                rational_fit, rational_partial)
+        self.assertTrue(np.allclose(result, expected))
+
+    def testBinaryStream(self):
+        destination = os.path.join(self.directory, 'quadratic.npy')
+        FileReader().to_binary(self.files['quadratic'], destination)
+        result = gauss_newton_stream(destination, (1, 3, -1), 5, qr_fact_househ,
+                                     QUADRATIC, block_size=30)
+        expected = gauss_newton(self.files['quadratic'], (1, 3, -1), 5, qr_fact_househ,
+                                QUADRATIC, None)
+        self.assertTrue(np.allclose(result, expected))
+
+    def testEmptyStream(self):
+        filename = os.path.join(self.directory, 'empty.txt')
+        open(filename, 'w').close()
+        self.assertRaises(ValueError, gauss_newton_stream, filename, (1, 3, -1), 5,
+                          qr_fact_househ, QUADRATIC)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import math
+import numpy as np
+from factorizations import givens_append_rows, qr_solve
+from gauss_newton import gauss_newton_converge, as_model, load_points, residuals, \
+    jacobian, solve, norm
+
+# refit from scratch once the linearization at B mispredicts the residuals of
+# the new points after a step by more than this, relative to their size
+DRIFT_TOLERANCE = 1e-3
+
+class IncrementalFit(object):
+    """
+    Keeps a gauss-newton fit up to date as points are appended. Besides the
+    parameters it keeps R and q.transpose() * r of the jacobian at those
+    parameters, and folds only the new rows into them with givens rotations.
+    One step on the updated factorization then gives the fit of every point
+    so far, at a cost proportional to the number of new points.
+
+    R describes the old points linearized at the old parameters, which stops
+    being accurate once the parameters move far on a nonlinear curve. The
+    new points show how far: when the residuals the linearization predicts
+    for them after a step are off by more than drift_tolerance, the whole
+    fit is recomputed with gauss_newton_converge, warm started from the
+    current parameters. Linear curves such as polynomials never drift.
+    """
+
+    def __init__(self, initial_guess, qr, fit, partial=None,
+                 drift_tolerance=DRIFT_TOLERANCE, **options):
+        """
+        Input:
+            initial_guess: the initial guesses for the parameters, used for
+                the first fit
+            qr: the qr factorization algorithm used for full fits (function)
+            fit: the curve to approximate (function, Model or expression)
+            partial: the partial derivative of the curve (function)
+            drift_tolerance: the relative linearization error that triggers a
+                full refit
+            options: passed on to gauss_newton_converge for full fits
+        """
+        self.params = np.array(initial_guess, dtype=float)
+        self.qr = qr
+        self.model = as_model(fit, partial)
+        self.drift_tolerance = drift_tolerance
+        self.options = options
+        self.blocks = []
+        self.count = 0
+        self.R = None
+        self.qtr = None
+        # the part of the residual sum of squares R can't reduce
+        self.sum_squares = 0.0
+
+    def append(self, points):
+        """
+        Input:
+            points: a filename or an array of the new (x, y) points
+
+        Returns:
+            {
+            params: the parameters fitting every point so far
+            residual: the norm of the residual vector over every point
+            points: the number of points fitted
+            refit: True if the fit was recomputed from scratch
+            }
+        """
+        points = np.array(load_points(points), dtype=float)
+        self.blocks.append(points)
+        self.count += len(points)
+        if self.R is None:
+            return self.refit()
+
+        B = self.params
+        J = jacobian(B, points, self.model)
+        r = residuals(B, points, self.model)
+        R, qtr, rest = givens_append_rows(self.R, self.qtr, J, r)
+        try:
+            x = solve(R, qtr)
+        except np.linalg.LinAlgError:
+            return self.refit()
+        # the old rows are only known through their linearization at B, so
+        # check how well it predicts the new rows after the step
+        predicted = r - np.dot(J, x)
+        error = norm(residuals(B - x, points, self.model) - predicted)
+        if error > self.drift_tolerance * (norm(predicted) + norm(r - predicted)):
+            return self.refit()
+
+        # after the step r becomes r - J x, so q.transpose() * r becomes qtr - R x
+        self.params = B - x
+        self.R = R
+        self.qtr = qtr - np.dot(R, x)
+        self.sum_squares += np.dot(rest, rest)
+        return self.result(False)
+
+    def refit(self):
+        """
+        Fits every point so far from scratch, warm started from the current
+        parameters, and refactors the jacobian at the new parameters
+
+        Returns:
+            the same dictionary as append
+        """
+        points = np.vstack(self.blocks)
+        self.blocks = [points]
+        result = gauss_newton_converge(points, self.params, self.qr, self.model,
+                                       **self.options)
+        self.params = result['params']
+        n = len(self.params)
+        J = jacobian(self.params, points, self.model)
+        r = residuals(self.params, points, self.model)
+        R, qtr = qr_solve(self.qr, J, r)
+        self.R = R[:n]
+        self.qtr = qtr[:n]
+        self.sum_squares = np.dot(qtr[n:], qtr[n:])
+        return self.result(True)
+
+    def result(self, refit):
+        """
+        Input:
+            refit: whether the fit was just recomputed from scratch
+
+        Returns:
+            the dictionary returned by append
+        """
+        return {
+            'params': self.params,
+            'residual': math.sqrt(self.sum_squares + np.dot(self.qtr, self.qtr)),
+            'points': self.count,
+            'refit': refit
+        }
@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+from gauss_newton import *
+from incremental import IncrementalFit
+
+class IncrementalFitTests(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        xs = np.linspace(1, 10, 300)
+        self.quadratic = np.column_stack([
+            xs, QUADRATIC.fit(np.array([1.0, 3.0, -1.0]), xs) + 0.1 * random.standard_normal(300)])
+        xs = random.uniform(1, 10, 300)
+        self.exponential = np.column_stack([
+            xs, EXPONENTIAL.fit(np.array([-0.2, 0.5, -0.07]), xs) + 1e-3 * random.standard_normal(300)])
+
+    def testLinear(self):
+        fit = IncrementalFit((0, 0, 0), qr_fact_househ, QUADRATIC)
+        self.assertTrue(fit.append(self.quadratic[:100])['refit'])
+        for start in (100, 200):
+            result = fit.append(self.quadratic[start:start + 100])
+            self.assertFalse(result['refit'])
+        full = gauss_newton_converge(self.quadratic, (0, 0, 0), qr_fact_househ, QUADRATIC)
+        self.assertEqual(result['points'], 300)
+        self.assertTrue(np.allclose(result['params'], full['params']))
+        self.assertAlmostEqual(result['residual'], full['residual'])
+
+    def testThinQr(self):
+        # np.linalg.qr returns a thin q, the residual still has to count the
+        # part of r outside its columns
+        fit = IncrementalFit((0, 0, 0), np.linalg.qr, QUADRATIC)
+        result = fit.append(self.quadratic)
+        full = gauss_newton_converge(self.quadratic, (0, 0, 0), qr_fact_househ, QUADRATIC)
+        self.assertTrue(np.allclose(result['params'], full['params']))
+        self.assertAlmostEqual(result['residual'], full['residual'])
+
+    def testNonlinear(self):
+        fit = IncrementalFit((-0.3, 0.3, 0.3), qr_fact_givens, EXPONENTIAL)
+        fit.append(self.exponential[:150])
+        refits = [fit.append(self.exponential[start:start + 10])['refit']
+                  for start in range(150, 300, 10)]
+        self.assertFalse(any(refits))
+        full = gauss_newton_converge(self.exponential, (-0.3, 0.3, 0.3), qr_fact_househ,
+                                     EXPONENTIAL)
+        self.assertTrue(np.allclose(fit.params, full['params'], atol=1e-4))
+
+    def testDrift(self):
+        fit = IncrementalFit((-0.3, 0.3, 0.3), qr_fact_househ, EXPONENTIAL)
+        fit.append(self.exponential[:100])
+        xs = self.exponential[100:, 0]
+        moved = np.column_stack([xs, EXPONENTIAL.fit(np.array([-0.5, 0.3, 0.2]), xs)])
+        result = fit.append(moved)
+        self.assertTrue(result['refit'])
+        expected = gauss_newton_converge(np.vstack([self.exponential[:100], moved]),
+                                         result['params'], qr_fact_househ, EXPONENTIAL)
+        self.assertTrue(np.allclose(result['params'], expected['params']))
+        self.assertAlmostEqual(result['residual'], expected['residual'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
-from gauss_newton import *
+import sys
+
+# numpy and the solvers are imported inside the functions that use them, so
+# running a batch (python main.py jobs.jsonl) starts without loading them
 
 def main():
     filename = raw_input('Please input the name of the text file containing the points: ')
@@ -19,6 +22,7 @@ def main():
     print "2.) exponential"
     print "3.) logarithmic"
     print "4.) rational"
+    print "5.) automatic (fit all four and pick the best)"
 
     option = raw_input('Which curve would you like to approximate?' +
                         '\nPlease select the corresponding number: ')
@@ -31,6 +35,11 @@ def main():
         result = gn_log(filename, guess, iterations)
     elif option == "4":
         result = gn_rat(filename, guess, iterations)
+    elif option == "5":
+        results = gn_auto(filename, guess, iterations)
+        for fit in results:
+            print "{name:<12} residual {residual:<12.6g} aic {aic:<12.6g} {params}".format(**fit)
+        result = '{} {}'.format(results[0]['name'], results[0]['params'])
 
     print "................................"    
     print "The answer is {}".format(result)
@@ -48,6 +57,7 @@ def gn_qua(filename, initial_guess, iterations):
         the parameters giving the best approximation for the appropriate curve
         matching the given points
     """
+    from gauss_newton import gauss_newton, qr_fact_househ, quadratic_fit, quadratic_partial
     return gauss_newton(filename, initial_guess, iterations,
                         qr_fact_househ, quadratic_fit, quadratic_partial)
 
@@ -65,6 +75,7 @@ def gn_exp(filename, initial_guess, iterations):
         the parameters giving the best approximation for the appropriate curve
         matching the given points
     """
+    from gauss_newton import gauss_newton, qr_fact_househ, exponential_fit, exponential_partial
     return gauss_newton(filename, initial_guess, iterations,
                         qr_fact_househ, exponential_fit, exponential_partial)
 
@@ -81,6 +92,7 @@ def gn_log(filename, initial_guess, iterations):
         the parameters giving the best approximation for the appropriate curve
         matching the given points
     """
+    from gauss_newton import gauss_newton, qr_fact_househ, logarithmic_fit, logarithmic_partial
     return gauss_newton(filename, initial_guess, iterations, 
                         qr_fact_househ, logarithmic_fit, logarithmic_partial)
 
@@ -97,8 +109,34 @@ def gn_rat(filename, initial_guess, iterations):
         the parameters giving the best approximation for the appropriate curve
         matching the given points
     """
+    from gauss_newton import gauss_newton, qr_fact_househ, rational_fit, rational_partial
     return gauss_newton(filename, initial_guess, iterations,
                         qr_fact_househ, rational_fit, rational_partial)
 
+def gn_auto(filename, initial_guess, iterations, guesses=None):
+    """
+    Fits all four curves to the points concurrently and ranks them
+
+    Input:
+        filename: the name of the file containing the points
+        initial_guess: the initial guesses for for the parameters a, b, and c
+        iterations: the most iterations to run for each curve
+        guesses: optional {curve name: initial guess} for curves that need a
+            different starting point
+
+    Returns:
+        a list of the fits ordered best first by aic, each with the curve
+        'name', 'params', 'residual' and 'aic'
+    """
+    from gauss_newton import CURVES
+    from parallel import fit_models
+    return fit_models(filename, CURVES, initial_guess, guesses,
+                      max_iterations=iterations)
+
 if __name__ == '__main__':
+    # with arguments run a batch of jobs instead of asking for a single fit,
+    # see batch.py
+    if len(sys.argv) > 1:
+        from batch import main as run_batch
+        sys.exit(run_batch(sys.argv[1:]))
     main()
\ No newline at end of file
@@ -0,0 +1,168 @@
+import math
+import multiprocessing
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from multiprocessing.sharedctypes import RawArray
+from gauss_newton import gauss_newton_converge, load_points, qr_fact_househ
+
+# the points shared with this worker process, set up by share_points
+shared = {}
+
+def multistart(points, initial_guesses, qr, fit, partial=None, processes=None,
+               threshold=None, **options):
+    """
+    Runs gauss_newton_converge from many initial guesses at once on a pool of
+    worker processes and keeps the best fit. The points are copied once into
+    shared memory that every worker reads from, instead of being pickled for
+    each guess.
+
+    Input:
+        points: a filename or an array of (x, y) points
+        initial_guesses: a list of initial guesses for the parameters
+        qr: the qr factorization algorithm to use (function)
+        fit: the curve to approximate (function or Model), it has to be
+            picklable so module level functions and models work but closures
+            (such as polynomial_model) don't
+        partial: the partial derivative of the curve (function)
+        processes: the number of worker processes, defaults to the cpu count
+        threshold: stop as soon as a fit's residual norm is this small and
+            cancel the guesses that are still running
+        options: passed on to gauss_newton_converge (max_iterations,
+            tolerances, damping)
+
+    Returns:
+        the gauss_newton_converge result with the smallest residual norm, with
+        the initial guess that produced it under 'guess'
+    """
+    points = load_points(points)
+    buffer = RawArray('d', points.size)
+    np.frombuffer(buffer).reshape(points.shape)[:] = points
+
+    tasks = [(tuple(guess), qr, fit, partial, options) for guess in initial_guesses]
+    pool = multiprocessing.Pool(processes, share_points, (buffer, points.shape))
+    best = None
+    try:
+        for result in pool.imap_unordered(fit_guess, tasks):
+            if best is None or better(result, best):
+                best = result
+            if threshold is not None and best['residual'] <= threshold:
+                break
+    finally:
+        # cancels anything that is still running once the threshold is met
+        pool.terminate()
+        pool.join()
+    return best
+
+def share_points(buffer, shape):
+    """
+    Pool initializer, wraps the shared buffer of points as an array without
+    copying it
+
+    Input:
+        buffer: the shared RawArray holding the points
+        shape: the shape of the points array
+    """
+    shared['points'] = np.frombuffer(buffer).reshape(shape)
+
+def fit_guess(task):
+    """
+    Input:
+        task: (guess, qr, fit, partial, options) for a single fit
+
+    Returns:
+        the result of try_fit on the shared points
+    """
+    guess, qr, fit, partial, options = task
+    return try_fit(shared['points'], guess, qr, fit, partial, options)
+
+def fit_models(points, models, initial_guess, guesses=None, qr=qr_fact_househ,
+               **options):
+    """
+    Fits several curves to the same points concurrently on a thread pool and
+    ranks them. The points are loaded once and shared by every thread.
+
+    Input:
+        points: a filename or an array of (x, y) points
+        models: a list of (name, Model) pairs to fit
+        initial_guess: the initial guess used for every model
+        guesses: optional {name: initial guess} overriding initial_guess
+        qr: the qr factorization algorithm to use (function)
+        options: passed on to gauss_newton_converge
+
+    Returns:
+        a list of gauss_newton_converge results, each with the model's 'name'
+        and its 'aic' (akaike information criterion), best (lowest aic) first
+    """
+    points = load_points(points)
+    guesses = guesses or {}
+
+    def fit_model(model):
+        name, fit = model
+        result = try_fit(points, guesses.get(name, initial_guess), qr, fit, None, options)
+        result['name'] = name
+        result['aic'] = aic(result['residual'], len(points), len(result['params']))
+        return result
+
+    pool = ThreadPool(len(models))
+    try:
+        results = pool.map(fit_model, models)
+    finally:
+        pool.close()
+        pool.join()
+    return sorted(results, key=lambda result: result['aic'])
+
+def try_fit(points, guess, qr, fit, partial, options):
+    """
+    Input:
+        points: an array of (x, y) points
+        guess: the initial guess for the parameters
+        qr, fit, partial, options: passed on to gauss_newton_converge
+
+    Returns:
+        the result of gauss_newton_converge. A guess that fails outright gets
+        an infinite residual, the reason 'error' and the exception under
+        'error'.
+    """
+    try:
+        result = gauss_newton_converge(points, guess, qr, fit, partial, **options)
+    except (np.linalg.LinAlgError, ValueError, ArithmeticError) as error:
+        result = {
+            'params': np.array(guess, dtype=float),
+            'iterations': 0,
+            'residual': float('inf'),
+            'reason': 'error',
+            'error': '{}: {}'.format(type(error).__name__, error)
+        }
+    result['guess'] = guess
+    return result
+
+def aic(residual, points, parameters):
+    """
+    Input:
+        residual: the norm of the residual vector of a fit
+        points: the number of points fitted
+        parameters: the number of parameters of the curve
+
+    Returns:
+        the akaike information criterion of the least squares fit, lower is
+        better
+    """
+    if not np.isfinite(residual):
+        return float('inf')
+    if not residual:
+        return float('-inf')
+    return points * math.log(residual ** 2 / points) + 2 * parameters
+
+def better(result, best):
+    """
+    Input:
+        result: a fit result
+        best: the best fit result so far
+
+    Returns:
+        True if result has a smaller residual than best, a residual that is
+        nan never wins
+    """
+    if np.isnan(best['residual']):
+        return not np.isnan(result['residual'])
+    return result['residual'] < best['residual']
@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+from gauss_newton import *
+from parallel import multistart, fit_models, aic
+
+class ParallelTests(unittest.TestCase):
+
+    def setUp(self):
+        xs = np.linspace(1, 10, 40)
+        self.expected = (-0.2, 0.5, -0.07)
+        self.points = np.column_stack([xs, EXPONENTIAL.fit(np.array(self.expected), xs)])
+        self.guesses = [(1, 1, 1), (-0.3, 0.3, 0.3), (5, -2, 0), (-1, 0.1, 1)]
+
+    def testMultistart(self):
+        result = multistart(self.points, self.guesses, qr_fact_househ,
+                            exponential_fit, exponential_partial, processes=2)
+        self.assertTrue(np.allclose(result['params'], self.expected, atol=1e-6))
+        self.assertTrue(result['guess'] in self.guesses)
+
+    def testMultistartThreshold(self):
+        result = multistart(self.points, self.guesses * 5, qr_fact_househ,
+                            EXPONENTIAL, processes=2, threshold=1e-6)
+        self.assertTrue(result['residual'] <= 1e-6)
+
+    def testFitModels(self):
+        models = [('quadratic', QUADRATIC), ('exponential', EXPONENTIAL),
+                  ('rational', RATIONAL)]
+        results = fit_models(self.points, models, (1, 3, -1),
+                             {'exponential': (-0.3, 0.3, 0.3)})
+        self.assertEqual(results[0]['name'], 'exponential')
+        self.assertTrue(np.allclose(results[0]['params'], self.expected, atol=1e-6))
+        self.assertEqual(sorted(r['name'] for r in results), sorted(m[0] for m in models))
+
+    def testAic(self):
+        self.assertTrue(aic(1.0, 40, 3) < aic(2.0, 40, 3))
+        self.assertTrue(aic(1.0, 40, 3) < aic(1.0, 40, 4))
+        self.assertEqual(aic(float('nan'), 40, 3), float('inf'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,28 @@
 import numpy as np
 import math
+import hashlib
 import matplotlib.pyplot as plot
 import random
+from collections import OrderedDict
+from factorizations import qr_fact_househ, househ_factor, househ_factor_blocked, \
+    househ_apply, back_substitute
+from profiler import NULL_PROFILER
 
-def power_method(A, initial_guess, tolerance, max_iterations):
+# power_method only computes the determinant of matrices up to this size
+# unless asked to, it costs far more than the iteration on anything bigger
+DETERMINANT_SIZE = 32
+
+# number of factorizations of A - shift * I kept for inverse_iteration
+FACTORIZATION_CACHE_SIZE = 32
+factorization_cache = OrderedDict()
+
+def power_method(A, initial_guess, tolerance, max_iterations, shift=0, profiler=None,
+                 det=None):
     """
     Input:
-        A: a square matrix with floating point real numbers as entries
+        A: a square n x n matrix with floating point real numbers as entries,
+            either dense or sparse (anything with a dot method, such as a
+            scipy CSR matrix), or a function matvec(u) returning A * u
 
         initial_guess: vector of n floating point real numbers that serves as
             the initial guess for an eigenvector of A
@@ -17,36 +33,52 @@ def power_method(A, initial_guess, tolerance, max_iterations):
         max_iterations: positive integer giving the maximum number of times to
             iterate the power method befor quiting
 
+        shift: iterate with A - shift * I, which converges faster when the
+            shift moves the other eigenvalues closer to zero
+
+        profiler: optional Profiler recording the time of every step and
+            the change in the eigenvalue from the previous step
+
+        det: whether to compute the determinant of a dense A, which takes an
+            O(n^3) factorization. By default it is only computed for matrices
+            of up to DETERMINANT_SIZE rows.
+
     Returns:
         {
         value: the eigenvalue of A
-        vector: the eigenvector of A
+        vector: the unit eigenvector of A
         iterations: the number of iterations
-        trace: the trace of A 
-        det: the determinant of A
+        trace: the trace of A (None when A is a function)
+        det: the determinant of A (None unless A is dense and det allows it)
         }
     """
     # load A and initial_guess into a numpy array
-    A = np.array(A)
-    initial_guess = np.array(initial_guess)
+    if not callable(A) and not hasattr(A, 'dot'):
+        A = np.array(A, dtype=float)
+    matvec = as_matvec(A)
+    u = np.array(initial_guess, dtype=float)
+    u = u / np.linalg.norm(u)
 
     # we're going to need this later for computing the next eigenvector
     prior_eigenvalue = 0
 
+    enabled = profiler is not None
+    profiler = profiler or NULL_PROFILER
+
     # load the first iteraton before starting the algorithm
-    u = np.dot(A, initial_guess)
-    eigenvalue = u[0]
-    u = u / float(eigenvalue)
-    initial_guess = u
+    with profiler.span('step', 1):
+        eigenvalue, u = power_step(matvec, u, shift)
     iterations = 1
+    if enabled:
+        profiler.metric('eigenvalue_delta', 1, abs(eigenvalue - prior_eigenvalue))
 
     while abs(eigenvalue - prior_eigenvalue) > tolerance:
         prior_eigenvalue = eigenvalue
-        u = np.dot(A, initial_guess)
-        eigenvalue = u[0]
-        u = u / float(eigenvalue)
-        initial_guess = u
         iterations += 1
+        with profiler.span('step', iterations):
+            eigenvalue, u = power_step(matvec, u, shift)
+        if enabled:
+            profiler.metric('eigenvalue_delta', iterations, abs(eigenvalue - prior_eigenvalue))
 
         # we need to quit if we haven't found the eigenvalue within the
         # alloted iterations
@@ -57,55 +89,318 @@ def power_method(A, initial_guess, tolerance, max_iterations):
         'value': eigenvalue,
         'vector': u,
         'iterations': iterations,
-        'trace': trace(A),
-        'det': determinant(A)
+        'trace': None if callable(A) else trace(A),
+        'det': determinant(A) if wants_determinant(A, det) else None
+    }
+
+def subspace_iteration(A, k, tolerance, max_iterations, initial_guess=None):
+    """
+    Finds the k eigenvalues of A with the largest magnitude by running the
+    power method on k vectors at once and re-orthonormalizing them with a
+    householder qr after every step. Leading vectors are locked once their
+    eigenvalue converges and aren't multiplied by A again.
+
+    Input:
+        A: a square n x n matrix (dense or sparse) or a function returning
+            A * U for an n x m block of vectors U
+
+        k: the number of eigenpairs to find
+
+        tolerance: positive floating point real number that determines when
+            each eigenvalue is close enough
+
+        max_iterations: positive integer giving the maximum number of times to
+            iterate before quiting
+
+        initial_guess: n x k array of starting vectors, random when not given
+            (required when A is a function)
+
+    Returns:
+        {
+        value: array of the k eigenvalues, largest magnitude first
+        vector: n x k array of the orthonormal eigenvectors
+        iterations: array of the number of iterations each eigenpair took
+        converged: boolean array, False where max_iterations was reached
+        }
+    """
+    if not callable(A) and not hasattr(A, 'dot'):
+        A = np.array(A, dtype=float)
+    matvec = as_matvec(A)
+    if initial_guess is None:
+        initial_guess = np.random.RandomState(0).standard_normal((A.shape[0], k))
+    Q, R = qr_fact_househ(np.array(initial_guess, dtype=float), mode='economic')
+
+    values = np.zeros(k)
+    prior = np.zeros(k)
+    iterations = np.zeros(k, dtype=int)
+    converged = np.zeros(k, dtype=bool)
+
+    # the first locked columns of Q have converged
+    locked = 0
+    for iteration in range(1, max_iterations + 1):
+        active = Q[:, locked:]
+        Z = matvec(active)
+        values[locked:] = np.einsum('ij,ij->j', active, Z)
+        if locked:
+            Z -= np.dot(Q[:, :locked], np.dot(Q[:, :locked].transpose(), Z))
+        Q[:, locked:], R = qr_fact_househ(Z, mode='economic')
+
+        done = np.abs(values[locked:] - prior[locked:]) <= tolerance
+        prior[locked:] = values[locked:]
+        iterations[locked:] = iteration
+        # only a leading run of converged vectors can be locked, the ones
+        # after it still depend on the vectors in front of them
+        newly_locked = len(done) if done.all() else done.argmin()
+        converged[locked:locked + newly_locked] = True
+        locked += newly_locked
+        if locked == k:
+            break
+
+    return {
+        'value': values,
+        'vector': Q,
+        'iterations': iterations,
+        'converged': converged
+    }
+
+def inverse_iteration(A, initial_guess, tolerance, max_iterations, shift=0):
+    """
+    Finds the eigenvalue of A closest to shift by running the power method on
+    (A - shift * I)^-1. The inverse is never formed, A - shift * I is factored
+    once and every iteration is a householder apply and a back substitution.
+
+    Input:
+        A: a square n x n matrix with floating point real numbers as entries
+
+        initial_guess: vector of n floating point real numbers that serves as
+            the initial guess for an eigenvector of A
+
+        tolerance: positive floating point real number that determines when the
+            approximation is close enough
+
+        max_iterations: positive integer giving the maximum number of times to
+            iterate before quiting
+
+        shift: the eigenvalue closest to shift is found, 0 finds the smallest
+
+    Returns:
+        {
+        value: the eigenvalue of A closest to shift
+        vector: the unit eigenvector of A
+        iterations: the number of iterations
+        }
+        or None if it didn't converge within max_iterations
+    """
+    A = np.asarray(A, dtype=float)
+    V, tau, R = shifted_factorization(A, shift)
+    u = np.array(initial_guess, dtype=float)
+    u = u / np.linalg.norm(u)
+
+    prior_eigenvalue = None
+    for iterations in range(1, max_iterations + 1):
+        w = back_substitute(R, househ_apply(V, tau, u.copy(), transpose=True), tolerance=0)
+        # w = (A - shift * I)^-1 u, so the rayleigh quotient estimates
+        # 1 / (eigenvalue - shift)
+        eigenvalue = shift + 1 / np.dot(u, w)
+        u = w / np.linalg.norm(w)
+        if prior_eigenvalue is not None and abs(eigenvalue - prior_eigenvalue) <= tolerance:
+            return {
+                'value': eigenvalue,
+                'vector': u,
+                'iterations': iterations
+            }
+        prior_eigenvalue = eigenvalue
+    return None
+
+def shifted_factorization(A, shift):
+    """
+    Input:
+        A: a square matrix
+        shift: the shift to subtract from the diagonal of A
+
+    Returns:
+        (V, tau, R) the householder factorization of A - shift * I. The most
+        recently used factorizations are cached so repeated calls with the
+        same matrix and shift don't factor it again, the arrays are shared
+        with the cache and are read only.
+
+        A shift equal to an eigenvalue makes A - shift * I singular, the usual
+        case when refining an eigenvalue found some other way. Pivots of R
+        that are zero to working precision are raised to machine epsilon
+        (relative to the largest pivot) so R can still be solved with. The
+        solutions then grow huge along the eigenvector, which is just what
+        inverse iteration wants.
+    """
+    key = (A.shape, hashlib.sha1(np.ascontiguousarray(A)).hexdigest(), shift)
+    if key in factorization_cache:
+        factorization = factorization_cache.pop(key)
+    else:
+        V, tau, R = househ_factor_blocked(A - shift * np.eye(len(A)))
+        pivots = np.diagonal(R)
+        scale = np.abs(pivots).max() if len(R) else 0
+        # when the shifted matrix is all zeros fall back on the scale of A
+        floor = np.finfo(float).eps * (scale or np.abs(A).max() or 1.0)
+        tiny = np.abs(pivots) < floor
+        R[tiny, tiny] = np.where(pivots[tiny] < 0, -floor, floor)
+        for array in (V, tau, R):
+            array.flags.writeable = False
+        factorization = (V, tau, R)
+        if len(factorization_cache) >= FACTORIZATION_CACHE_SIZE:
+            factorization_cache.popitem(last=False)
+    factorization_cache[key] = factorization
+    return factorization
+
+def power_step(matvec, u, shift=0):
+    """
+    Input:
+        matvec: function returning A * u
+        u: the current unit vector
+        shift: the shift applied to A
+
+    Returns:
+        (eigenvalue, u) the rayleigh quotient estimate of the eigenvalue of A
+        and the next unit vector
+    """
+    w = matvec(u) - shift * u
+    eigenvalue = np.dot(u, w) + shift
+    size = np.linalg.norm(w)
+    if size:
+        w = w / size
+    return eigenvalue, w
+
+def as_matvec(A):
+    """
+    Input:
+        A: a dense or sparse matrix, or a function matvec(u)
+
+    Returns:
+        a function returning A * u
+    """
+    if callable(A):
+        return A
+    return A.dot
+
+def power_method_batch(A, initial_guess, tolerance, max_iterations):
+    """
+    Runs the power method on a whole stack of matrices at once. Every system
+    is stepped together with a single einsum and is dropped from the stack
+    as soon as it converges.
+
+    Input:
+        A: an N x n x n array of square matrices
+
+        initial_guess: a vector of n numbers used as the initial guess for
+            every matrix, or an N x n array with one guess per matrix
+
+        tolerance: positive floating point real number that determines when the
+            approximation is close enough
+
+        max_iterations: positive integer giving the maximum number of times to
+            iterate the power method before quiting
+
+    Returns:
+        {
+        value: array of the N eigenvalues
+        vector: N x n array of the unit eigenvectors
+        iterations: array of the number of iterations used by each matrix
+        converged: boolean array, False where max_iterations was reached
+        }
+    """
+    A = np.asarray(A, dtype=float)
+    N, n = A.shape[:2]
+    u = np.array(np.broadcast_to(initial_guess, (N, n)), dtype=float)
+    u /= np.linalg.norm(u, axis=1)[:, np.newaxis]
+
+    values = np.zeros(N)
+    vectors = np.zeros((N, n))
+    iterations = np.zeros(N, dtype=int)
+    converged = np.zeros(N, dtype=bool)
+
+    # the systems that are still iterating and their positions in the output
+    index = np.arange(N)
+    prior = np.zeros(N)
+    for iteration in range(1, max_iterations + 1):
+        w = np.einsum('ijk,ik->ij', A, u)
+        # rayleigh quotient, u is always a unit vector
+        value = np.einsum('ij,ij->i', u, w)
+        norms = np.linalg.norm(w, axis=1)
+        norms[norms == 0] = 1
+        u = w / norms[:, np.newaxis]
+
+        done = np.abs(value - prior) <= tolerance
+        if done.any():
+            finished = index[done]
+            values[finished] = value[done]
+            vectors[finished] = u[done]
+            iterations[finished] = iteration
+            converged[finished] = True
+            keep = ~done
+            index, A, u, value = index[keep], A[keep], u[keep], value[keep]
+        prior = value
+        if not len(index):
+            break
+
+    # whatever is left ran out of iterations
+    values[index] = prior
+    vectors[index] = u
+    iterations[index] = max_iterations
+
+    return {
+        'value': values,
+        'vector': vectors,
+        'iterations': iterations,
+        'converged': converged
     }
 
+def wants_determinant(A, det):
+    """
+    Input:
+        A: the matrix given to power_method
+        det: the det argument given to power_method
+
+    Returns:
+        True if power_method should compute the determinant of A
+    """
+    if not isinstance(A, np.ndarray):
+        return False
+    if det is None:
+        return len(A) <= DETERMINANT_SIZE
+    return det
+
 def trace(A):
     """
     Input:
-        A: a 2 by 2 matrix
+        A: a square matrix, dense or sparse
 
     Returns:
         the trace of A
     """
-
-    # since A will always be a 2 by 2 matrix we can just hardcode this
-    return A[0][0] + A[1][1]
+    return A.diagonal().sum()
 
 def invert(A):
     """
     Input:
-        A: a 2 by 2 matrix
+        A: a square matrix
 
     Returns:
         the inverse of A
     """
-
-    # since A will always be a 2 by 2 matrix we can just hardcode this
-    a = A[0][0]
-    b = A[0][1]
-    c = A[1][0]
-    d = A[1][1]
-    cofactor = np.array([[d, -b],
-                        [-c, a]])
-    
-    return determinant(A) * cofactor
+    A = np.asarray(A, dtype=float)
+    R, qtb = qr_fact_househ(A, mode='solve', rhs=np.eye(len(A)))
+    return back_substitute(R, qtb)
 
 def determinant(A):
     """ 
     Input:
-        A: a 2 by 2 matrix
+        A: a square matrix
 
     Returns:
         the determinant of A
     """
-
-    a = A[0][0]
-    b = A[0][1]
-    c = A[1][0]
-    d = A[1][1]
-    return a * d - b * c
+    # A = q * r and every householder reflection in q has determinant -1
+    V, tau, R = househ_factor(A)
+    sign = -1 if np.count_nonzero(tau) % 2 else 1
+    return sign * np.prod(np.diagonal(R))
 
 def get_matrix():
     """
@@ -132,37 +427,28 @@ def main():
     Performs the graphing actions of this part of the assignment
     """
     #initialize a 1000 matrices
-    matrices = []
-    while len(matrices) < 1000:
-        matrices.append(get_matrix())
-    inverses = [invert(m) for m in  matrices]
+    matrices = np.array([get_matrix() for i in range(1000)])
+    inverses = np.array([invert(m) for m in matrices])
 
     e = 0.00005
     max_runs = 100
     
-    # the next two for loops run power_method on all the matrices and their
-    # inverses. if the eigenvalue is found then the resulting data is added
-    # to the list
-    data = []
-    for m in matrices:
-        power_method_result = power_method(m, [1,1], e, max_runs)
-        if power_method_result:
-            data.append(power_method_result)
-    
-    inverse_data = []
-    for inverse in inverses:
-        power_method_result = power_method(inverse, [1,1], e, max_runs)
-        if power_method_result:
-            inverse_data.append(power_method_result)
+    # run the power method on all of the matrices and their inverses at once,
+    # only the matrices whose eigenvalue was found are graphed
+    data = power_method_batch(matrices, [1, 1], e, max_runs)
+    found = data['converged']
+
+    inverse_data = power_method_batch(inverses, [1, 1], e, max_runs)
+    inverse_found = inverse_data['converged']
 
     # Graph Matrices Data
     plot.figure(1)
     plot.title('Determinant vs. Trace')
     plot.xlabel('Determinant')
     plot.ylabel('Trace')
-    plot.scatter([m['det'] for m in data],
-                 [m['trace'] for m in data],
-                 c = [m['iterations'] for m in data])
+    plot.scatter(np.linalg.det(matrices)[found],
+                 np.trace(matrices, axis1=1, axis2=2)[found],
+                 c = data['iterations'][found])
     # plot.show()
 
     # Graph Inverse Matrices Data
@@ -170,11 +456,10 @@ def main():
     plot.title(' Inverse Determinant vs. Trace')
     plot.xlabel('Determinant')
     plot.ylabel('Trace')
-    t = []
 
-    plot.scatter([m['det'] for m in inverse_data],
-                 [m['trace'] for m in inverse_data],
-                 c = [m['iterations'] for m in inverse_data])
+    plot.scatter(np.linalg.det(inverses)[inverse_found],
+                 np.trace(inverses, axis1=1, axis2=2)[inverse_found],
+                 c = inverse_data['iterations'][inverse_found])
     plot.show()
 
 if __name__ == '__main__':
@@ -1,6 +1,7 @@
 import unittest
 import power_method
 import math
+import numpy as np
 
 class PowerMethodTests(unittest.TestCase):
 
@@ -19,11 +20,100 @@ class PowerMethodTests(unittest.TestCase):
         self.assertTrue(abs(result['value'] - eigenvalue) <= e)
         self.assertTrue(result['iterations'] < MAX_ITERATIONS)
 
+    def testPowerMethodBatch(self):
+        e = 0.00005
+        MAX_ITERATIONS = 20
+        matrices = [self.A, [[2, 0], [0, 1]], [[0, 2], [1, 0]]]
+        result = power_method.power_method_batch(matrices, [1, 1], e, MAX_ITERATIONS)
+        self.assertTrue(abs(result['value'][0] - (2 + math.sqrt(13))) <= e)
+        self.assertTrue(abs(result['value'][1] - 2) <= e)
+        # the eigenvalues of the last matrix are +-sqrt(2), neither dominates
+        self.assertEqual(list(result['converged']), [True, True, False])
+        self.assertEqual(result['iterations'][2], MAX_ITERATIONS)
+        self.assertTrue(np.allclose(np.linalg.norm(result['vector'], axis=1), 1))
+
+    def testPowerMethodFirstComponentZero(self):
+        # the dominant eigenvector (0, 1) used to divide by zero
+        result = power_method.power_method([[1, 0], [0, 3]], [1, 1], 0.00005, 50)
+        self.assertTrue(abs(result['value'] - 3) <= 0.00005)
+        self.assertTrue(abs(result['vector'][0]) < 0.01)
+
+    def testPowerMethodLarge(self):
+        A = np.diag(np.arange(1, 11, dtype=float))
+        A[0][9] = 1
+        result = power_method.power_method(A, np.ones(10), 1e-10, 500)
+        self.assertTrue(abs(result['value'] - 10) <= 1e-6)
+
+    def testPowerMethodDeterminant(self):
+        A = np.eye(50) * 2
+        A[0][0] = 3
+        result = power_method.power_method(A, np.ones(50), 1e-10, 500)
+        self.assertEqual(result['det'], None)
+        self.assertEqual(result['trace'], 101)
+        result = power_method.power_method(A, np.ones(50), 1e-10, 500, det=True)
+        self.assertTrue(abs(result['det'] / (3 * 2.0 ** 49) - 1) < 1e-12)
+        result = power_method.power_method(self.A, [1, 1], 0.00005, 20, det=False)
+        self.assertEqual(result['det'], None)
+
+    def testPowerMethodMatvec(self):
+        A = np.array(self.A, dtype=float)
+        result = power_method.power_method(A.dot, [1, 1], 0.00005, 20, shift=-1)
+        self.assertTrue(abs(result['value'] - (2 + math.sqrt(13))) <= 0.00005)
+        self.assertEqual(result['trace'], None)
+
+    def testSubspaceIteration(self):
+        A = np.diag([1.0, -6.0, 0.5, 3.0, 9.0, 0.25])
+        A[0][1] = A[1][0] = 0.1
+        expected = sorted(np.linalg.eigvalsh(A), key=abs, reverse=True)[:3]
+        result = power_method.subspace_iteration(A, 3, 1e-10, 500)
+        self.assertTrue(result['converged'].all())
+        self.assertTrue(np.allclose(result['value'], expected, atol=1e-8))
+        vectors = result['vector']
+        self.assertTrue(np.allclose(np.dot(vectors.transpose(), vectors), np.eye(3)))
+
+    def testInverseIteration(self):
+        A = np.array([[4, 1, 0], [1, 3, 1], [0, 1, 2]], dtype=float)
+        values = np.linalg.eigvalsh(A)
+        result = power_method.inverse_iteration(A, [1, 1, 1], 1e-10, 100)
+        self.assertTrue(abs(result['value'] - values[0]) <= 1e-8)
+        result = power_method.inverse_iteration(A, [1, 1, 1], 1e-10, 100, shift=3.1)
+        self.assertTrue(abs(result['value'] - values[1]) <= 1e-8)
+
+    def testInverseIterationExactShift(self):
+        A = np.array([[4, 1, 0], [1, 3, 1], [0, 1, 2]], dtype=float)
+        for shift in np.linalg.eigvalsh(A):
+            result = power_method.inverse_iteration(A, [1, 1, 1], 1e-10, 100, shift=shift)
+            self.assertTrue(abs(result['value'] - shift) <= 1e-8)
+            self.assertTrue(np.linalg.norm(np.dot(A, result['vector']) -
+                                           result['value'] * result['vector']) <= 1e-8)
+        # an exactly zero pivot
+        result = power_method.inverse_iteration(np.diag([1.0, 2.0, 3.0]), [1, 1, 1], 1e-10, 100,
+                                                shift=2)
+        self.assertEqual(result['value'], 2)
+        self.assertTrue(np.allclose(np.abs(result['vector']), [0, 1, 0]))
+        # a matrix that is all zeros once shifted
+        result = power_method.inverse_iteration(np.eye(3), [1, 0, 0], 1e-10, 100, shift=1)
+        self.assertTrue(abs(result['value'] - 1) <= 1e-8)
+
+    def testShiftedFactorizationCache(self):
+        A = np.array(self.A, dtype=float)
+        first = power_method.shifted_factorization(A, 0.5)
+        self.assertTrue(power_method.shifted_factorization(A, 0.5) is first)
+        self.assertFalse(power_method.shifted_factorization(A, 0.25) is first)
+        for array in first:
+            self.assertFalse(array.flags.writeable)
+
     def testTrace(self):
-        pass
+        self.assertEqual(power_method.trace(np.array(self.A)), 4)
 
     def testDeterminant(self):
-        pass
+        self.assertTrue(abs(power_method.determinant(self.A) + 9) < 1e-12)
+        A = np.random.RandomState(0).standard_normal((5, 5))
+        self.assertTrue(abs(power_method.determinant(A) - np.linalg.det(A)) < 1e-10)
+
+    def testInvert(self):
+        inverse = power_method.invert(self.A)
+        self.assertTrue(np.allclose(np.dot(self.A, inverse), np.eye(2)))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
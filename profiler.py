@@ -0,0 +1,192 @@
+import json
+import timeit
+import numpy as np
+
+# number of records a Profiler keeps before overwriting the oldest ones
+RING_SIZE = 65536
+
+# one record, either a timed phase (duration >= 0, value nan) or a metric
+# (duration nan). Times are in seconds since the profiler was created.
+RECORD = np.dtype([('name', np.int32), ('iteration', np.int64),
+                   ('start', np.float64), ('duration', np.float64),
+                   ('value', np.float64)])
+
+class Profiler(object):
+    """
+    Collects per iteration records from the solvers into a ring buffer that is
+    allocated up front. Solvers take an optional profiler and only record
+    anything when they are given one, so leaving it out costs nothing.
+
+    Phases are timed with span:
+        with profiler.span('qr', iteration):
+            ...
+    and values such as residual norms are recorded with metric.
+    """
+
+    def __init__(self, capacity=RING_SIZE):
+        """
+        Input:
+            capacity: the number of records to keep, once full the oldest
+                records are overwritten
+        """
+        self.buffer = np.zeros(capacity, dtype=RECORD)
+        self.count = 0
+        self.names = []
+        self.codes = {}
+        self.clock = timeit.default_timer
+        self.origin = self.clock()
+
+    def code(self, name):
+        """
+        Input:
+            name: a phase or metric name
+
+        Returns:
+            the number the name is stored as in the buffer
+        """
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+    def record(self, name, iteration, start, duration, value):
+        """
+        Input:
+            name: the phase or metric name
+            iteration: the solver iteration the record belongs to
+            start: when it happened, in seconds since the profiler was created
+            duration: how long the phase took in seconds (nan for metrics)
+            value: the metric's value (nan for phases)
+        """
+        self.buffer[self.count % len(self.buffer)] = \
+            (self.code(name), iteration, start, duration, value)
+        self.count += 1
+
+    def span(self, name, iteration):
+        """
+        Input:
+            name: the phase being timed
+            iteration: the solver iteration
+
+        Returns:
+            a context manager recording how long its body takes
+        """
+        return Span(self, name, iteration)
+
+    def metric(self, name, iteration, value):
+        """
+        Input:
+            name: the quantity, such as 'residual_norm'
+            iteration: the solver iteration
+            value: its value
+        """
+        self.record(name, iteration, self.clock() - self.origin, np.nan, value)
+
+    def records(self):
+        """
+        Returns:
+            the records still in the buffer, oldest first, as a list of
+            {name, iteration, start, duration, value}
+        """
+        capacity = len(self.buffer)
+        if self.count <= capacity:
+            kept = self.buffer[:self.count]
+        else:
+            split = self.count % capacity
+            kept = np.concatenate([self.buffer[split:], self.buffer[:split]])
+        return [{
+            'name': self.names[record['name']],
+            'iteration': int(record['iteration']),
+            'start': float(record['start']),
+            'duration': float(record['duration']),
+            'value': float(record['value'])
+        } for record in kept]
+
+    def to_csv(self, filename):
+        """
+        Writes the records to a csv file with the columns name, iteration,
+        start, duration and value. Empty cells stand for nan.
+
+        Input:
+            filename: the file to write
+        """
+        with open(filename, 'w') as output:
+            output.write('name,iteration,start,duration,value\n')
+            for record in self.records():
+                output.write('{},{},{},{},{}\n'.format(
+                    record['name'], record['iteration'], repr(record['start']),
+                    cell(record['duration']), cell(record['value'])))
+
+    def to_chrome_trace(self, filename, process='solver'):
+        """
+        Writes the records in the chrome trace event format, which can be
+        opened in chrome://tracing or perfetto. Phases become complete events
+        and metrics become counters.
+
+        Input:
+            filename: the json file to write
+            process: the process name shown for the events
+        """
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': 0,
+                   'args': {'name': process}}]
+        for record in self.records():
+            event = {'name': record['name'], 'pid': 0, 'tid': 0,
+                     'ts': record['start'] * 1e6}
+            if np.isnan(record['duration']):
+                event.update(ph='C', args={record['name']: record['value']})
+            else:
+                event.update(ph='X', dur=record['duration'] * 1e6,
+                             args={'iteration': record['iteration']})
+            events.append(event)
+        with open(filename, 'w') as output:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+
+class Span(object):
+    """
+    Times the body of a with statement and records it in a Profiler
+    """
+
+    def __init__(self, profiler, name, iteration):
+        self.profiler = profiler
+        self.name = name
+        self.iteration = iteration
+
+    def __enter__(self):
+        self.start = self.profiler.clock()
+        return self
+
+    def __exit__(self, *exception):
+        end = self.profiler.clock()
+        self.profiler.record(self.name, self.iteration, self.start - self.profiler.origin,
+                             end - self.start, np.nan)
+        return False
+
+class NullProfiler(object):
+    """
+    Stands in for a Profiler when a solver isn't given one, every method does
+    nothing
+    """
+
+    def span(self, name, iteration):
+        return NULL_SPAN
+
+    def metric(self, name, iteration, value):
+        pass
+
+class NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+NULL_SPAN = NullSpan()
+NULL_PROFILER = NullProfiler()
+
+def cell(value):
+    """
+    Returns:
+        value formatted for a csv file, nan as an empty cell
+    """
+    return '' if np.isnan(value) else repr(value)
@@ -0,0 +1,79 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from profiler import Profiler
+from gauss_newton import gauss_newton, qr_fact_househ, QUADRATIC
+from power_method import power_method
+
+class ProfilerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testGaussNewton(self):
+        xs = np.linspace(1, 10, 50)
+        filename = os.path.join(self.directory, 'points.npy')
+        np.save(filename, np.column_stack([xs, QUADRATIC.fit(np.array([1.0, 3.0, -1.0]), xs)]))
+        profiler = Profiler()
+        plain = gauss_newton(filename, (0, 0, 0), 3, qr_fact_househ, QUADRATIC, None)
+        profiled = gauss_newton(filename, (0, 0, 0), 3, qr_fact_househ, QUADRATIC, None, profiler)
+        self.assertTrue(np.array_equal(plain, profiled))
+
+        records = profiler.records()
+        self.assertEqual([r['name'] for r in records[:6]],
+                         ['qr', 'solve', 'residual', 'jacobian', 'step', 'residual_norm'])
+        self.assertEqual(len(records), 18)
+        self.assertEqual(records[-1]['iteration'], 2)
+        for record in records[:4]:
+            self.assertTrue(record['duration'] >= 0)
+            self.assertTrue(np.isnan(record['value']))
+        # the quadratic is fitted exactly after one step
+        self.assertTrue(records[5]['value'] < 1e-8)
+
+    def testPowerMethod(self):
+        profiler = Profiler()
+        result = power_method([[2, 0], [0, 1]], (1, 1), 1e-10, 100, profiler=profiler)
+        deltas = [r for r in profiler.records() if r['name'] == 'eigenvalue_delta']
+        steps = [r for r in profiler.records() if r['name'] == 'step']
+        self.assertEqual(len(deltas), result['iterations'])
+        self.assertEqual(len(steps), result['iterations'])
+        self.assertTrue(deltas[-1]['value'] <= 1e-10)
+        self.assertEqual(deltas[-1]['iteration'], result['iterations'])
+
+    def testRingBuffer(self):
+        profiler = Profiler(capacity=4)
+        for i in range(10):
+            profiler.metric('value', i, i * 2.0)
+        records = profiler.records()
+        self.assertEqual([r['iteration'] for r in records], [6, 7, 8, 9])
+        self.assertEqual([r['value'] for r in records], [12, 14, 16, 18])
+
+    def testExport(self):
+        profiler = Profiler()
+        with profiler.span('work', 0):
+            pass
+        profiler.metric('residual_norm', 0, 0.5)
+
+        filename = os.path.join(self.directory, 'trace.csv')
+        profiler.to_csv(filename)
+        with open(filename) as source:
+            lines = source.read().splitlines()
+        self.assertEqual(lines[0], 'name,iteration,start,duration,value')
+        self.assertTrue(lines[1].startswith('work,0,') and lines[1].endswith(','))
+        self.assertTrue(lines[2].startswith('residual_norm,0,') and lines[2].endswith(',,0.5'))
+
+        filename = os.path.join(self.directory, 'trace.json')
+        profiler.to_chrome_trace(filename)
+        with open(filename) as source:
+            events = json.load(source)['traceEvents']
+        self.assertEqual([e['ph'] for e in events], ['M', 'X', 'C'])
+        self.assertEqual(events[2]['args'], {'residual_norm': 0.5})
+
+if __name__ == '__main__':
+    unittest.main()
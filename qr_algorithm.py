@@ -0,0 +1,196 @@
+import numpy as np
+import math
+from factorizations import househ_vector, househ_apply
+
+# eigenvalues whose imaginary parts are this small (relative to the largest
+# eigenvalue) are returned as real numbers
+IMAGINARY_TOLERANCE = 1e-10
+
+def hessenberg(A):
+    """
+    Input:
+        A: a square matrix
+
+    Returns:
+        (V, tau, H) the upper hessenberg matrix H = q.transpose() * A * q,
+        where q is the product of the householder reflectors stored in V and
+        tau (see factorizations.househ_factor, the reflector for column k acts
+        on rows k + 1 and down)
+    """
+    H = np.array(A, dtype=float)
+    n = len(H)
+    V = np.zeros((n, max(n - 2, 0)))
+    tau = np.zeros(max(n - 2, 0))
+    for k in range(n - 2):
+        v, tau[k], beta = househ_vector(H[k + 1:, k])
+        V[k + 1:, k] = v
+        if tau[k]:
+            # reflect rows k + 1 and down, then columns k + 1 and on
+            block = H[k + 1:, k + 1:]
+            block -= tau[k] * np.outer(v, np.dot(v, block))
+            block = H[:, k + 1:]
+            block -= tau[k] * np.outer(np.dot(block, v), v)
+        H[k + 1, k] = beta
+        H[k + 2:, k] = 0
+    return V, tau, H
+
+def hessenberg_q(V, tau):
+    """
+    Input:
+        V: the reflector vectors returned by hessenberg
+        tau: the reflector scalars returned by hessenberg
+
+    Returns:
+        q such that A = q * H * q.transpose()
+    """
+    n = len(V)
+    q = np.eye(n)
+    # the reflectors start one row down, so they are applied to the trailing
+    # n - 1 rows
+    if len(tau):
+        househ_apply(V[1:], tau, q[1:])
+    return q
+
+def eigenvalues(A, tolerance=1e-14, max_iterations=None):
+    """
+    Computes every eigenvalue of A with the shifted qr algorithm. A is first
+    reduced to hessenberg form, then each sweep chases a wilkinson shifted
+    bulge down the active part of the matrix with givens rotations (O(n^2)
+    per sweep) and deflates any subdiagonal entries that become negligible.
+
+    Input:
+        A: a square matrix
+        tolerance: a subdiagonal entry is treated as zero once it is this
+            small relative to its neighbours on the diagonal
+        max_iterations: the most sweeps to run before giving up, defaults to
+            30 per eigenvalue
+
+    Returns:
+        an array of the eigenvalues of A, complex if any of them are
+
+    Raises:
+        LinAlgError if the iteration doesn't converge
+    """
+    V, tau, H = hessenberg(A)
+    H = H.astype(complex)
+    n = len(H)
+    if max_iterations is None:
+        max_iterations = 30 * max(n, 1)
+
+    values = np.zeros(n, dtype=complex)
+    iterations = 0
+    since_deflation = 0
+    hi = n - 1
+    while hi >= 0:
+        # find the start of the unreduced block that ends at hi
+        lo = hi
+        while lo > 0 and not negligible(H, lo, tolerance):
+            lo -= 1
+        if lo > 0:
+            H[lo, lo - 1] = 0
+        if lo == hi:
+            values[hi] = H[hi, hi]
+            hi -= 1
+            since_deflation = 0
+            continue
+
+        iterations += 1
+        since_deflation += 1
+        if iterations > max_iterations:
+            raise np.linalg.LinAlgError(
+                'qr algorithm did not converge in {} sweeps'.format(max_iterations))
+        if since_deflation % 10 == 0:
+            # exceptional shift to break out of a cycle
+            shift = H[hi, hi] + abs(H[hi, hi - 1])
+        else:
+            shift = wilkinson_shift(H[hi - 1:hi + 1, hi - 1:hi + 1])
+        qr_sweep(H, lo, hi, shift)
+
+    if np.abs(values.imag).max() <= IMAGINARY_TOLERANCE * max(np.abs(values).max(), 1):
+        return values.real
+    return values
+
+def negligible(H, k, tolerance):
+    """
+    Input:
+        H: a hessenberg matrix
+        k: the row of the subdiagonal entry H[k, k - 1]
+        tolerance: the relative tolerance
+
+    Returns:
+        True if H[k, k - 1] can be treated as zero
+    """
+    scale = abs(H[k, k]) + abs(H[k - 1, k - 1])
+    if not scale:
+        scale = np.abs(H).max()
+    return abs(H[k, k - 1]) <= tolerance * scale
+
+def wilkinson_shift(B):
+    """
+    Input:
+        B: the trailing 2 x 2 block of the active matrix
+
+    Returns:
+        the eigenvalue of B closest to its bottom right entry
+    """
+    a, b = B[0]
+    c, d = B[1]
+    half = (a - d) / 2
+    root = np.sqrt(half * half + b * c + 0j)
+    # pick the sign that avoids cancellation, this is the root nearest d
+    if abs(half + root) < abs(half - root):
+        root = -root
+    if half + root == 0:
+        return d
+    return d - b * c / (half + root)
+
+def qr_sweep(H, lo, hi, shift):
+    """
+    Runs one implicitly shifted qr step on the block H[lo:hi + 1, lo:hi + 1]
+    in place by chasing a bulge down the subdiagonal with givens rotations.
+
+    Input:
+        H: a complex hessenberg matrix
+        lo: the first row of the active block
+        hi: the last row of the active block
+        shift: the shift for this step
+    """
+    x = H[lo, lo] - shift
+    y = H[lo + 1, lo]
+    for k in range(lo, hi):
+        c, s = complex_givens(x, y)
+        # rotate rows k and k + 1, then columns k and k + 1
+        start = max(k - 1, lo)
+        top = H[k, start:hi + 1].copy()
+        H[k, start:hi + 1] = c * top + s * H[k + 1, start:hi + 1]
+        H[k + 1, start:hi + 1] = c * H[k + 1, start:hi + 1] - np.conj(s) * top
+        end = min(k + 2, hi)
+        left = H[lo:end + 1, k].copy()
+        H[lo:end + 1, k] = c * left + np.conj(s) * H[lo:end + 1, k + 1]
+        H[lo:end + 1, k + 1] = c * H[lo:end + 1, k + 1] - s * left
+        if k > lo:
+            H[k + 1, k - 1] = 0
+        if k + 2 <= hi:
+            x = H[k + 1, k]
+            y = H[k + 2, k]
+
+def complex_givens(x, y):
+    """
+    Input:
+        x: the value to rotate onto
+        y: the value to zero out
+
+    Returns:
+        (c, s) with c real such that the rotation [[c, s], [-conj(s), c]]
+        takes (x, y) to (r, 0)
+    """
+    r = math.hypot(abs(x), abs(y))
+    if not r:
+        return 1.0, 0j
+    if not abs(x):
+        return 0.0, np.conj(y) / abs(y)
+    return abs(x) / r, (x / abs(x)) * np.conj(y) / r
+
+if __name__ == '__main__':
+    A = np.array([[3, 4], [3, 1]])
+    print eigenvalues(A)
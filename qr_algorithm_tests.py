@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+import qr_algorithm
+
+class QRAlgorithmTests(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(0)
+
+    def testHessenberg(self):
+        A = self.random.standard_normal((6, 6))
+        V, tau, H = qr_algorithm.hessenberg(A)
+        q = qr_algorithm.hessenberg_q(V, tau)
+        self.assertTrue(np.allclose(np.tril(H, -2), 0))
+        self.assertTrue(np.allclose(np.dot(q, np.dot(H, q.transpose())), A))
+
+    def testSymmetric(self):
+        A = self.random.standard_normal((20, 20))
+        A = A + A.transpose()
+        values = qr_algorithm.eigenvalues(A)
+        self.assertEqual(values.dtype, np.float64)
+        self.assertTrue(np.allclose(np.sort(values), np.linalg.eigvalsh(A)))
+
+    def testComplexEigenvalues(self):
+        A = self.random.standard_normal((15, 15))
+        values = qr_algorithm.eigenvalues(A)
+        for expected in np.linalg.eigvals(A):
+            self.assertTrue(np.abs(values - expected).min() < 1e-8)
+
+    def testPowerMethodMatrix(self):
+        values = qr_algorithm.eigenvalues([[3, 4], [3, 1]])
+        self.assertTrue(np.allclose(sorted(values), [2 - np.sqrt(13), 2 + np.sqrt(13)]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import math
+import numpy as np
+from factorizations import qr_solve
+from gauss_newton import as_model, load_points, jacobian, solve, MAX_DAMPING
+
+# tuning constants giving 95% efficiency on normally distributed residuals
+HUBER = 1.345
+CAUCHY = 2.385
+
+class Workspace(object):
+    """
+    The weighted jacobian, the least squares system and the residual and
+    weight vectors a robust fit fills in on every iteration, allocated once
+    per fit. Models that take out= (the built in ones and compiled
+    expressions) write their jacobian straight into J, and it is weighted in
+    place. Every step copies J into the system, which has n extra rows below
+    it for the levenberg-marquardt damping, and qr_fact_househ factors the
+    system in place. A retried step starts again from J. The householder
+    reflectors are still a new rows x n array on every factorization, and
+    other qr functions factor a copy.
+    """
+
+    def __init__(self, points, n):
+        """
+        Input:
+            points: the array of (x, y) points being fitted
+            n: the number of parameters
+        """
+        m = len(points)
+        self.xs = np.ascontiguousarray(points[:, 0])
+        self.ys = np.ascontiguousarray(points[:, 1])
+        self.r = np.empty(m)
+        self.candidate_r = np.empty(m)
+        self.u = np.empty(m)
+        self.weights = np.empty(m)
+        self.sqrt_weights = np.empty(m)
+        self.J = np.empty((m, n))
+        self.weighted_r = np.empty(m)
+        self.system = np.empty((m + n, n))
+        self.rhs = np.empty(m + n)
+
+    def step(self, qr, damping):
+        """
+        Input:
+            qr: the qr factorization algorithm to use (function)
+            damping: the levenberg-marquardt damping
+
+        Returns:
+            the step minimizing |J x - weighted_r|^2 + damping * |x|^2
+        """
+        m = len(self.J)
+        self.system[:m] = self.J
+        self.rhs[:m] = self.weighted_r
+        if not damping:
+            R, qtr = qr_solve(qr, self.system[:m], self.rhs[:m], overwrite=True)
+        else:
+            # the damping rows were overwritten by the last factorization
+            self.system[m:] = 0
+            self.rhs[m:] = 0
+            np.fill_diagonal(self.system[m:], math.sqrt(damping))
+            R, qtr = qr_solve(qr, self.system, self.rhs, overwrite=True)
+        return solve(R, qtr)
+
+def gauss_newton_robust(points, initial_guess, qr, fit, partial=None, weights=None,
+                        loss='huber', scale=None, max_iterations=100,
+                        step_tolerance=1e-8, damping=1e-3):
+    """
+    Weighted and robust gauss-newton by iteratively reweighted least squares.
+    Every iteration weights each point by its own weight times the weight
+    the robust loss gives its current residual, then takes a weighted
+    gauss-newton step through the usual qr path. Outliers get small weights
+    so they barely pull on the fit. Steps are damped levenberg-marquardt
+    style like gauss_newton_converge, a step that doesn't reduce the robust
+    cost is retried with more damping.
+
+    Input:
+        points: a filename or an array of (x, y) points
+        initial_guess: the initial guesses for the parameters
+        qr: the qr factorization algorithm to use (function)
+        fit: the curve to approximate (function, Model or expression)
+        partial: the partial derivative of the curve (function)
+        weights: optional array of non negative per point weights
+        loss: 'linear' (plain weighted least squares), 'huber' or 'cauchy'
+        scale: the scale residuals are measured in by the loss, estimated
+            from the median absolute residual on every iteration when None
+        max_iterations: the most steps to take before giving up
+        step_tolerance: stop once the step is this small relative to B
+        damping: the initial levenberg-marquardt damping, 0 for plain
+            (undamped) steps
+
+    Returns:
+        {
+        params: the parameters giving the best approximation
+        iterations: the number of steps taken
+        residual: the norm of the final (unweighted) residual vector
+        weights: the final weight of every point
+        reason: why the solver stopped, one of 'step', 'max_iterations',
+            'damping' (no damped step reduced the robust cost) or
+            'singular' (an undamped step had no unique solution)
+        }
+    """
+    if loss not in LOSSES:
+        raise ValueError('Unknown loss {}, expected one of {}'.format(loss, sorted(LOSSES)))
+    rho, robust_weights = LOSSES[loss]
+    points = load_points(points)
+    model = as_model(fit, partial)
+    B = np.array(initial_guess, dtype=float)
+    work = Workspace(points, len(B))
+    point_weights = np.ones(len(points)) if weights is None else np.asarray(weights, dtype=float)
+
+    iterations = 0
+    reason = 'max_iterations'
+    np.subtract(work.ys, model.fit(B, work.xs), out=work.r)
+    while iterations < max_iterations:
+        iterations += 1
+        s = scale or estimate_scale(work.r)
+        np.divide(work.r, s, out=work.u)
+        robust_weights(work.u, work.weights)
+        work.weights *= point_weights
+        np.sqrt(work.weights, out=work.sqrt_weights)
+        jacobian(B, points, model, out=work.J)
+        work.J *= work.sqrt_weights[:, np.newaxis]
+        np.multiply(work.r, work.sqrt_weights, out=work.weighted_r)
+        cost = robust_cost(work.r, s, point_weights, rho)
+
+        # retry with more damping until the step reduces the robust cost
+        # (or, when the damping is too small to make up for a singular
+        # jacobian, until the step can be solved for)
+        while True:
+            try:
+                x = work.step(qr, damping)
+            except np.linalg.LinAlgError:
+                if not damping:
+                    reason = 'singular'
+                    break
+                x = None
+            if x is not None:
+                candidate = B - x
+                np.subtract(work.ys, model.fit(candidate, work.xs), out=work.candidate_r)
+                if not damping or robust_cost(work.candidate_r, s, point_weights, rho) <= cost:
+                    break
+            damping *= 10
+            if damping > MAX_DAMPING:
+                reason = 'damping'
+                break
+        if reason != 'max_iterations':
+            break
+
+        B = candidate
+        work.r, work.candidate_r = work.candidate_r, work.r
+        damping /= 10
+        if math.sqrt(np.dot(x, x)) <= step_tolerance * (math.sqrt(np.dot(B, B)) + step_tolerance):
+            reason = 'step'
+            break
+
+    s = scale or estimate_scale(work.r)
+    robust_weights(work.r / s, work.weights)
+    return {
+        'params': B,
+        'iterations': iterations,
+        'residual': math.sqrt(np.dot(work.r, work.r)),
+        'weights': work.weights * point_weights,
+        'reason': reason
+    }
+
+def estimate_scale(r):
+    """
+    Input:
+        r: the residual vector
+
+    Returns:
+        a robust estimate of the standard deviation of the residuals, the
+        median absolute residual scaled to match a normal distribution
+    """
+    scale = 1.4826 * np.median(np.abs(r))
+    return scale or 1.0
+
+def robust_cost(r, scale, weights, rho):
+    """
+    Input:
+        r: the residual vector
+        scale: the scale of the residuals
+        weights: the per point weights
+        rho: the loss function
+
+    Returns:
+        the weighted robust cost of the residuals
+    """
+    return scale ** 2 * np.dot(weights, rho(r / scale))
+
+def linear_rho(u):
+    return 0.5 * u ** 2
+
+def linear_weights(u, out):
+    out.fill(1)
+    return out
+
+def huber_rho(u):
+    # quadratic up to HUBER and linear past it, written without squaring the
+    # large residuals
+    a = np.abs(u)
+    return 0.5 * np.minimum(a, HUBER) ** 2 + HUBER * np.maximum(a - HUBER, 0)
+
+def huber_weights(u, out):
+    """
+    Input:
+        u: the scaled residuals
+        out: the array to write the weights to
+
+    Returns:
+        out filled with min(1, HUBER / |u|)
+    """
+    np.abs(u, out=out)
+    np.maximum(out, HUBER, out=out)
+    np.divide(HUBER, out, out=out)
+    return out
+
+def cauchy_rho(u):
+    return 0.5 * CAUCHY ** 2 * np.log1p((u / CAUCHY) ** 2)
+
+def cauchy_weights(u, out):
+    """
+    Input:
+        u: the scaled residuals
+        out: the array to write the weights to
+
+    Returns:
+        out filled with 1 / (1 + (u / CAUCHY)^2)
+    """
+    np.divide(u, CAUCHY, out=out)
+    np.square(out, out=out)
+    out += 1
+    np.reciprocal(out, out=out)
+    return out
+
+# loss name: (rho, weight function)
+LOSSES = {
+    'linear': (linear_rho, linear_weights),
+    'huber': (huber_rho, huber_weights),
+    'cauchy': (cauchy_rho, cauchy_weights)
+}
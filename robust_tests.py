@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+from gauss_newton import *
+from robust import gauss_newton_robust, huber_weights, cauchy_weights, huber_rho, \
+    robust_cost, HUBER
+
+class RobustTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tolerance = 1e-3
+        xs = np.linspace(1, 10, 60)
+        self.expected = np.array([1.0, 3.0, -1.0])
+        ys = QUADRATIC.fit(self.expected, xs)
+        ys = ys + 0.01 * np.random.RandomState(0).standard_normal(len(xs))
+        # a few wild outliers
+        ys[[5, 20, 41]] += [40, -60, 80]
+        self.points = np.column_stack([xs, ys])
+
+    def testOutliersPullPlainFit(self):
+        result = gauss_newton_robust(self.points, (0, 0, 0), qr_fact_househ, QUADRATIC,
+                                     loss='linear')
+        self.assertTrue(np.abs(result['params'] - self.expected).max() > 0.1)
+
+    def testHuber(self):
+        result = gauss_newton_robust(self.points, (0, 0, 0), qr_fact_househ, QUADRATIC,
+                                     loss='huber')
+        self.assertEqual(result['reason'], 'step')
+        self.assertTrue(np.abs(result['params'] - self.expected).max() < 0.05)
+        self.assertTrue(result['weights'][[5, 20, 41]].max() < 0.01)
+
+    def testCauchy(self):
+        result = gauss_newton_robust(self.points, (0, 0, 0), qr_fact_givens, QUADRATIC,
+                                     loss='cauchy')
+        self.assertTrue(np.abs(result['params'] - self.expected).max() < 0.05)
+
+    def testWeights(self):
+        weights = np.ones(len(self.points))
+        weights[[5, 20, 41]] = 0
+        result = gauss_newton_robust(self.points, (0, 0, 0), qr_fact_househ, QUADRATIC,
+                                     weights=weights, loss='linear')
+        self.assertTrue(np.abs(result['params'] - self.expected).max() < 0.05)
+
+    def testNonlinear(self):
+        xs = np.linspace(1, 10, 40)
+        B = np.array([-0.2, 0.5, -0.07])
+        ys = EXPONENTIAL.fit(B, xs)
+        ys[[3, 30]] += 5
+        result = gauss_newton_robust(np.column_stack([xs, ys]), (-0.3, 0.3, 0.3),
+                                     qr_fact_househ, EXPONENTIAL, loss='huber')
+        self.assertTrue(np.abs(result['params'] - B).max() < self.tolerance)
+
+    def testPoorGuess(self):
+        xs = np.linspace(1, 10, 40)
+        B = np.array([-0.2, 0.5, -0.07])
+        ys = EXPONENTIAL.fit(B, xs)
+        ys[[3, 30]] += 5
+        points = np.column_stack([xs, ys])
+        start = (0.5, -0.5, 0)
+        cost = robust_cost(points[:, 1] - EXPONENTIAL.fit(np.array(start), xs),
+                           1.0, np.ones(40), huber_rho)
+        result = gauss_newton_robust(points, start, qr_fact_househ, EXPONENTIAL, scale=1.0)
+        self.assertTrue(result['reason'] in ('step', 'damping', 'max_iterations'))
+        # a step that raises the robust cost is never taken
+        final = robust_cost(points[:, 1] - EXPONENTIAL.fit(result['params'], xs),
+                            1.0, np.ones(40), huber_rho)
+        self.assertTrue(final <= cost)
+
+    def testSingular(self):
+        # two identical columns in the jacobian
+        model = 'a*x + b*x'
+        result = gauss_newton_robust(self.points, (1, 1), qr_fact_househ, model, damping=0)
+        self.assertEqual(result['reason'], 'singular')
+        self.assertTrue(np.array_equal(result['params'], [1, 1]))
+        result = gauss_newton_robust(self.points, (1, 1), qr_fact_househ, model)
+        self.assertTrue(result['reason'] in ('step', 'damping', 'max_iterations'))
+
+    def testWeightFunctions(self):
+        u = np.array([0.0, 1.0, -2 * HUBER, 10.0])
+        out = np.empty(4)
+        self.assertTrue(np.allclose(huber_weights(u, out), [1, 1, 0.5, HUBER / 10]))
+        self.assertTrue(cauchy_weights(u, out)[0] == 1)
+        self.assertTrue(np.all(np.diff(out[[0, 1, 3]]) < 0))
+
+    def testModelWithoutOut(self):
+        # a jacobian that can't write into the workspace is copied there
+        model = Model(QUADRATIC.fit, lambda B, xs: QUADRATIC.jacobian(B, xs))
+        for qr in (qr_fact_househ, qr_fact_givens):
+            result = gauss_newton_robust(self.points, (0, 0, 0), qr, model)
+            expected = gauss_newton_robust(self.points, (0, 0, 0), qr, QUADRATIC)
+            self.assertTrue(np.allclose(result['params'], expected['params']))
+            self.assertEqual(result['iterations'], expected['iterations'])
+
+    def testUnknownLoss(self):
+        self.assertRaises(ValueError, gauss_newton_robust, self.points, (0, 0, 0),
+                          qr_fact_househ, QUADRATIC, loss='tukey')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,27 +1,360 @@
-import sys
+import os
+import re
+import json
+import hashlib
 import numpy as np
+from collections import OrderedDict
+
+# number of bytes read from a text file at a time
+CHUNK_SIZE = 1 << 24
+
+# a line that is neither blank nor a single x, y pair
+MALFORMED_LINE = re.compile(r'^(?![ \t\r]*$)(?![ \t\r]*[^\s,]+[ \t\r]*,[ \t\r]*[^\s,]+[ \t\r]*$)',
+                            re.MULTILINE)
+
+# number of bytes of parsed points a ParseCache keeps in memory
+CACHE_BUDGET = 1 << 28
+
+class ParseCache(object):
+    """
+    Remembers the points parsed from text files so reading the same file again
+    skips parsing. Parsed arrays are kept in memory, least recently used
+    first out once they take up more than budget bytes. With a directory the
+    arrays are also saved there as .npy files named by the sha1 of the text,
+    which later runs memory map instead of parsing. An entry is stale once
+    the file's modification time or size changes.
+
+    Callers get their own copy of an array kept in memory, so changing it
+    can't affect later reads. Arrays too big to keep are handed out as they
+    were parsed, without a copy. Arrays memory mapped from the directory are
+    handed out as they are and are read only, like .npy files read by
+    FileReader.
+    """
+
+    def __init__(self, directory=None, budget=CACHE_BUDGET):
+        """
+        Input:
+            directory: where to keep parsed arrays on disk, None to only
+                cache them in memory
+            budget: the most bytes of arrays to keep in memory
+        """
+        self.directory = directory
+        self.budget = budget
+        self.arrays = OrderedDict()
+        self.size = 0
+
+    def load(self, filename, parse):
+        """
+        Input:
+            filename: a text file of points
+            parse: function parsing the file into an array, called on a miss
+
+        Returns:
+            the points in the file, writable unless they are memory mapped
+            from the cache directory
+        """
+        path = os.path.abspath(filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # let parse raise the usual IOError
+            return parse(filename)
+        key = (path, stat.st_mtime, stat.st_size)
+        if key in self.arrays:
+            points = self.arrays.pop(key)
+        else:
+            points = self.load_disk(path, stat, parse) if self.directory else parse(filename)
+            self.forget(path)
+        if not self.remember(key, points) or isinstance(points, np.memmap):
+            return points
+        return points.copy()
+
+    def load_disk(self, path, stat, parse):
+        """
+        Input:
+            path: the absolute path of a text file of points
+            stat: the os.stat of the file
+            parse: function parsing the file into an array
+
+        Returns:
+            the points memory mapped from the cache directory, parsed and
+            saved there first if they aren't cached yet
+        """
+        index = self.read_index()
+        entry = index.get(path)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            digest = entry['hash']
+        else:
+            digest = file_hash(path)
+        cached = os.path.join(self.directory, digest + '.npy')
+        try:
+            points = np.load(cached, mmap_mode='r')
+        except (IOError, ValueError):
+            points = parse(path)
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # write to a temporary file first so readers never see half an array
+            temporary = '{}.{}.tmp.npy'.format(cached[:-4], os.getpid())
+            np.save(temporary, points)
+            os.rename(temporary, cached)
+        if entry != {'hash': digest, 'mtime': stat.st_mtime, 'size': stat.st_size}:
+            index[path] = {'hash': digest, 'mtime': stat.st_mtime, 'size': stat.st_size}
+            self.write_index(index)
+        return points
+
+    def read_index(self):
+        """
+        Returns:
+            {path: {hash, mtime, size}} for every file cached on disk
+        """
+        try:
+            with open(os.path.join(self.directory, 'index.json')) as index_file:
+                return json.load(index_file)
+        except (IOError, ValueError):
+            return {}
+
+    def write_index(self, index):
+        """
+        Input:
+            index: {path: {hash, mtime, size}} to save in the cache directory
+        """
+        filename = os.path.join(self.directory, 'index.json')
+        temporary = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(temporary, 'w') as index_file:
+            json.dump(index, index_file)
+        os.rename(temporary, filename)
+
+    def remember(self, key, points):
+        """
+        Keeps points in memory as the most recently used entry, dropping the
+        least recently used ones to stay within the budget
+
+        Input:
+            key: (path, mtime, size) of the file
+            points: the parsed points, made read only if they are kept
+
+        Returns:
+            False if points are bigger than the whole budget and weren't kept
+        """
+        if points.nbytes > self.budget:
+            return False
+        while self.arrays and self.size + points.nbytes > self.budget:
+            self.size -= self.arrays.popitem(last=False)[1].nbytes
+        points.flags.writeable = False
+        self.arrays[key] = points
+        self.size += points.nbytes
+        return True
+
+    def forget(self, path):
+        """
+        Input:
+            path: an absolute path whose stale arrays should be dropped
+        """
+        for key in [key for key in self.arrays if key[0] == path]:
+            self.size -= self.arrays.pop(key).nbytes
+
+    def clear(self):
+        """
+        Drops every array kept in memory, the cache directory is left alone
+        """
+        self.arrays.clear()
+        self.size = 0
+
+# the ParseCache used by every FileReader not given its own, None (parse every
+# time) until a program turns caching on with use_parse_cache
+parse_cache = None
+
+def use_parse_cache(cache):
+    """
+    Input:
+        cache: the ParseCache every FileReader not given its own should use,
+            for instance ParseCache() or ParseCache(directory), None to turn
+            caching back off
+    """
+    global parse_cache
+    parse_cache = cache
+
 class FileReader(object):
 
-    def vectorize(self, filename):
+    def __init__(self, chunk_size=CHUNK_SIZE, cache=None):
+        """
+        Input:
+            chunk_size: number of bytes of text to parse at a time
+            cache: the ParseCache holding parsed text files, defaults to the
+                one set by use_parse_cache
+        """
+        self.chunk_size = chunk_size
+        self.cache = cache
+
+    def vectorize(self, filename, mmap=True):
+        """
+        Input:
+            filename: text file containing n 2 dimensional tuples of points, or
+                a .npy file holding an n x 2 array
+            mmap: memory map .npy files instead of reading them in
+
+        Returns:
+            a vector representation of the points in the file, read only when
+            it is memory mapped
+
+        Raises:
+            IOError if the file can't be read, ValueError if it is malformed
+        """
+        if filename.endswith('.npy'):
+            return self.load_binary(filename, mmap)
+        cache = self.cache or parse_cache
+        if cache is not None:
+            return cache.load(filename, self.parse)
+        return self.parse(filename)
+
+    def parse(self, filename):
         """
         Input:
             filename: text file containing n 2 dimensional tuples of points
 
         Returns:
-            a vector representation of the points in the file
+            the points in the file
         """
-        try:
-            lines = open(filename, 'r').read().splitlines()
-        except IOError:
-            print "File IOError"
-            print "Unable to read from from file {}".format(filename)
-            print "Exiting now."
-            sys.exit()
-        vector = []
-        for line in lines:
-            x , y = line.split(',')
-            vector.append((float(x),float(y)))
-        return np.array(vector) 
+        # count the lines first so the points can be parsed straight into
+        # one preallocated array
+        vector = np.empty((self.count_lines(filename), 2))
+        filled = 0
+        for chunk in self.chunks(filename):
+            vector[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+        return vector[:filled]
+
+    def blocks(self, filename, block_size):
+        """
+        Input:
+            filename: a text or .npy file of points
+            block_size: the number of points in each block
+
+        Returns:
+            a generator of n x 2 arrays of block_size points, the last block
+            holds whatever is left over
+        """
+        if filename.endswith('.npy'):
+            points = self.load_binary(filename)
+            for start in range(0, len(points), block_size):
+                yield np.array(points[start:start + block_size])
+            return
+
+        block = np.empty((block_size, 2))
+        filled = 0
+        for chunk in self.chunks(filename):
+            while len(chunk):
+                taken = min(block_size - filled, len(chunk))
+                block[filled:filled + taken] = chunk[:taken]
+                chunk = chunk[taken:]
+                filled += taken
+                if filled == block_size:
+                    yield block.copy()
+                    filled = 0
+        if filled:
+            yield block[:filled].copy()
+
+    def chunks(self, filename):
+        """
+        Input:
+            filename: text file containing n 2 dimensional tuples of points
+
+        Returns:
+            a generator of n x 2 arrays, one for each chunk of text read from
+            the file. Chunks always end on a line boundary.
+        """
+        with open(filename, 'rb') as points_file:
+            remainder = ''
+            while True:
+                text = points_file.read(self.chunk_size)
+                if not text:
+                    break
+                text = remainder + text
+                end = text.rfind('\n') + 1
+                remainder = text[end:]
+                if end:
+                    yield parse_points(text[:end], filename)
+            if remainder.strip():
+                yield parse_points(remainder, filename)
+
+    def count_lines(self, filename):
+        """
+        Input:
+            filename: a text file
+
+        Returns:
+            an upper bound on the number of points in the file
+        """
+        lines = 1
+        with open(filename, 'rb') as points_file:
+            while True:
+                text = points_file.read(self.chunk_size)
+                if not text:
+                    return lines
+                lines += text.count('\n')
+
+    def load_binary(self, filename, mmap=True):
+        """
+        Input:
+            filename: a .npy file holding an n x 2 array of points
+            mmap: memory map the file instead of reading it in
+
+        Returns:
+            the points in the file
+        """
+        points = np.load(filename, mmap_mode='r' if mmap else None)
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError('{} holds an array of shape {}, expected n x 2'.format(
+                filename, points.shape))
+        return points
+
+    def to_binary(self, filename, destination):
+        """
+        Input:
+            filename: text file containing n 2 dimensional tuples of points
+            destination: the .npy file to write the points to
+
+        Returns:
+            the points written to destination
+        """
+        points = self.vectorize(filename)
+        np.save(destination, points)
+        return points
+
+def parse_points(text, filename=''):
+    """
+    Input:
+        text: lines of comma separated x, y pairs
+        filename: the file the text came from, for error messages
+
+    Returns:
+        an n x 2 array of the points in the text
+    """
+    # every non blank line has to hold exactly one comma between two values
+    if MALFORMED_LINE.search(text):
+        raise ValueError('Malformed points in file {}'.format(filename))
+    values = np.fromstring(text.replace(',', ' '), sep=' ')
+    # and every value has to be a number
+    if values.size != 2 * text.count(','):
+        raise ValueError('Malformed points in file {}'.format(filename))
+    return values.reshape(-1, 2)
+
+def file_hash(filename, chunk_size=CHUNK_SIZE):
+    """
+    Input:
+        filename: any file
+        chunk_size: number of bytes to hash at a time
+
+    Returns:
+        the hex sha1 digest of the file's contents
+    """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as source:
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                return digest.hexdigest()
+            digest.update(data)
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    pass
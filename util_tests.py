@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import util
+from util import FileReader, ParseCache, parse_points, use_parse_cache
+
+class FileReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.points = np.column_stack([np.arange(100) * 0.5, np.arange(100) ** 2])
+        self.filename = os.path.join(self.directory, 'points.txt')
+        with open(self.filename, 'w') as points_file:
+            points_file.write('\n'.join('{},{}'.format(x, y) for x, y in self.points))
+        # a tiny chunk size makes chunks split lines in the middle
+        self.reader = FileReader(chunk_size=64)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testVectorize(self):
+        self.assertTrue(np.array_equal(self.reader.vectorize(self.filename), self.points))
+
+    def testSharedCache(self):
+        # readers only cache once a program turns it on
+        self.assertTrue(util.parse_cache is None)
+        cache = ParseCache()
+        use_parse_cache(cache)
+        try:
+            points = FileReader().vectorize(self.filename)
+            # callers can still change what they get
+            points[:, 0] -= 1
+            self.assertTrue(np.array_equal(FileReader().vectorize(self.filename), self.points))
+            self.assertEqual(len(cache.arrays), 1)
+        finally:
+            use_parse_cache(None)
+
+    def testBlocks(self):
+        blocks = list(self.reader.blocks(self.filename, 30))
+        self.assertEqual([len(b) for b in blocks], [30, 30, 30, 10])
+        self.assertTrue(np.array_equal(np.vstack(blocks), self.points))
+
+    def testBinary(self):
+        destination = os.path.join(self.directory, 'points.npy')
+        self.reader.to_binary(self.filename, destination)
+        self.assertTrue(np.array_equal(self.reader.vectorize(destination), self.points))
+        blocks = list(self.reader.blocks(destination, 40))
+        self.assertTrue(np.array_equal(np.vstack(blocks), self.points))
+
+    def testMissingFile(self):
+        self.assertRaises(IOError, self.reader.vectorize,
+                          os.path.join(self.directory, 'missing.txt'))
+
+    def testMalformed(self):
+        with open(self.filename, 'a') as points_file:
+            points_file.write('\n1,2,3\n')
+        self.assertRaises(ValueError, self.reader.vectorize, self.filename)
+        # the right number of values and commas overall, but not per line
+        for text in ('1,2\n3,4,5\n6\n', '1,2,3\n4\n', '1 2,3\n4,\n', '1,2\nabc,3\n'):
+            with open(self.filename, 'w') as points_file:
+                points_file.write(text)
+            self.assertRaises(ValueError, self.reader.vectorize, self.filename)
+        self.assertRaises(ValueError, parse_points, '1,2\n3,4,5\n6\n')
+        self.assertTrue(np.array_equal(parse_points(' 1, 2\r\n\n3 ,4e1\n'), [[1, 2], [3, 40]]))
+
+class ParseCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'points.txt')
+        self.write('1,2\n3,4\n')
+        self.parsed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        with open(self.filename, 'w') as points_file:
+            points_file.write(text)
+
+    def parse(self, filename):
+        self.parsed.append(filename)
+        return FileReader().parse(filename)
+
+    def testMemory(self):
+        cache = ParseCache()
+        first = cache.load(self.filename, self.parse)
+        first[:, 0] -= 1
+        second = cache.load(self.filename, self.parse)
+        self.assertEqual(len(self.parsed), 1)
+        self.assertTrue(second.flags.writeable)
+        self.assertTrue(np.array_equal(second, [[1, 2], [3, 4]]))
+
+    def testStale(self):
+        cache = ParseCache()
+        cache.load(self.filename, self.parse)
+        self.write('1,2\n3,4\n5,6\n')
+        self.assertEqual(len(cache.load(self.filename, self.parse)), 3)
+        self.assertEqual(len(self.parsed), 2)
+        self.assertEqual(len(cache.arrays), 1)
+
+    def testBudget(self):
+        other = os.path.join(self.directory, 'other.txt')
+        shutil.copy(self.filename, other)
+        # room for one 2 x 2 array of floats
+        cache = ParseCache(budget=40)
+        cache.load(self.filename, self.parse)
+        cache.load(other, self.parse)
+        self.assertEqual(cache.size, 32)
+        cache.load(self.filename, self.parse)
+        self.assertEqual(len(self.parsed), 3)
+
+        # an array bigger than the budget is handed out as parsed, not kept
+        cache = ParseCache(budget=16)
+        points = cache.load(self.filename, self.parse)
+        self.assertTrue(points.flags.writeable)
+        self.assertEqual(len(cache.arrays), 0)
+        self.assertEqual(cache.size, 0)
+
+    def testDisk(self):
+        directory = os.path.join(self.directory, 'cache')
+        points = ParseCache(directory).load(self.filename, self.parse)
+        self.assertEqual(len([f for f in os.listdir(directory) if f.endswith('.npy')]), 1)
+
+        # a new process only has the files on disk
+        cached = ParseCache(directory).load(self.filename, self.parse)
+        self.assertEqual(len(self.parsed), 1)
+        self.assertTrue(isinstance(cached, np.memmap))
+        self.assertTrue(np.array_equal(cached, points))
+
+        # the same text in another file is found by its hash
+        other = os.path.join(self.directory, 'other.txt')
+        shutil.copy(self.filename, other)
+        ParseCache(directory).load(other, self.parse)
+        self.assertEqual(len(self.parsed), 1)
+
+        self.write('7,8\n')
+        self.assertTrue(np.array_equal(ParseCache(directory).load(self.filename, self.parse),
+                                       [[7, 8]]))
+        self.assertEqual(len(self.parsed), 2)
+
+if __name__ == '__main__':
+    unittest.main()